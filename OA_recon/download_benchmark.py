@@ -0,0 +1,94 @@
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+
+from OA_recon.mock_calc_server import add_mock_args, mock_from_args
+from OA_recon.oa_data_download import OADataDownload, EntityRegistry
+from utils import logger_setup
+
+logger = logger_setup("logs", "download_benchmark")
+
+
+"""
+Drives the real OADataDownload pipeline against the local mock calc server
+and reports throughput and latency percentiles, so concurrency and parsing
+changes can be compared without hitting a tenant.
+
+Example:
+    python -m OA_recon.download_benchmark -d 2025-03-31 -me 500 -w 16 -lm 0.3
+
+Results are appended to OA_recon/outputs/mock/benchmarks.jsonl.
+"""
+
+
+class DownloadBenchmark(OADataDownload):
+    def __init__(self):
+        OADataDownload.__init__(self)
+        self.mock = mock_from_args(self.args)
+
+    def add_extra_args(self):
+        OADataDownload.add_extra_args(self)
+        add_mock_args(self.parser)
+
+    def get_domain(self) -> str:
+        return self.mock.url
+
+    @property
+    def server_name(self):
+        return "mock"
+
+    def login(self) -> bool:
+        return self.api.d1g1t_login(username="benchmark", password="benchmark")
+
+    def reset_outputs(self):
+        """Start every benchmark from an empty output folder and registry."""
+        shutil.rmtree(self.output_folder, ignore_errors=True)
+        os.makedirs("OA_recon/inputs", exist_ok=True)
+        registry = EntityRegistry.get(self.server_name, self.args.level)
+        for file in [registry.csv_file, registry.meta_file]:
+            if os.path.exists(file):
+                os.remove(file)
+
+    def after_login(self):
+        self.reset_outputs()
+        self.create_output_folder()
+        start = time.perf_counter()
+        self.run_parallel_calcs()
+        wall_time = time.perf_counter() - start
+
+        with open(self.summary_file) as f:
+            summary = json.load(f)
+        result = {
+            "run_at": datetime.now().isoformat(),
+            "workers": self.args.workers or os.cpu_count(),
+            "entities": self.args.mock_entities,
+            "months": self.args.mock_months,
+            "latency_median": self.args.latency_median,
+            "latency_sigma": self.args.latency_sigma,
+            "accepted_rate": self.args.accepted_rate,
+            "error_rate": self.args.error_rate,
+            "wall_time_seconds": wall_time,
+            "entities_per_minute": summary["entities_per_minute"],
+            "latency_p50": summary["latency_p50"],
+            "latency_p95": summary["latency_p95"],
+            "observed_error_rate": summary["error_rate"],
+        }
+        with open(
+            os.path.join(os.path.dirname(self.output_folder), "benchmarks.jsonl"), "a"
+        ) as f:
+            f.write(json.dumps(result) + "\n")
+        logger.info(json.dumps(result, indent=4))
+
+    def main(self):
+        self.mock.start()
+        try:
+            OADataDownload.main(self)
+        finally:
+            self.mock.stop()
+
+
+if __name__ == "__main__":
+    work = DownloadBenchmark()
+    work.main()
@@ -0,0 +1,336 @@
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from utils import logger_setup
+
+logger = logger_setup("logs", "mock_calc_server", output="console")
+
+
+"""
+Local stand-in for the d1g1t API, used to benchmark OADataDownload offline.
+
+Implements:
+- POST api/v1/auth/login/: returns a dummy token
+- GET api/v1/data/<level>/?limit=&offset=: paginated entity list
+- POST api/v1/calc/net-asset-value-history/: synthetic monthly chart table
+
+Calc latency follows a lognormal distribution (--latency_median, --latency_sigma).
+A share of calcs (--accepted_rate) first answers 202 a few times, as the
+real server does while a calc is still running, and a share of calls
+(--error_rate) fails with a 500.
+"""
+
+NAV_CATEGORIES = [
+    ("date", "Date", "string"),
+    ("net-deposits", "Net Deposits", "decimal"),
+    ("net-additions", "Net Additions", "decimal"),
+    ("gain", "Gain", "decimal"),
+    ("fees", "Fees", "decimal"),
+    ("expenses", "Expenses", "decimal"),
+    ("market-value-eop", "Market Value EoP", "decimal"),
+    ("total-return", "Total Return", "decimal"),
+]
+
+
+class MockCalcServer:
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=8765,
+        entities=1000,
+        months=120,
+        latency_median=0.5,
+        latency_sigma=0.5,
+        accepted_rate=0.0,
+        accepted_retries=2,
+        error_rate=0.0,
+        seed=None,
+    ):
+        self.entities = entities
+        self.months = months
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.accepted_rate = accepted_rate
+        self.accepted_retries = accepted_retries
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.httpd = ThreadingHTTPServer((host, port), MockCalcHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"Mock calc server listening on {self.url}")
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def draw(self):
+        with self.lock:
+            return self.random.random()
+
+    def latency(self):
+        if self.latency_median <= 0:
+            return 0
+        with self.lock:
+            return self.random.lognormvariate(
+                math.log(self.latency_median), self.latency_sigma
+            )
+
+    def is_accepted(self, key):
+        """
+        Return True while a calc should still answer 202. The number of
+        pending answers is drawn on the first request for a given key.
+        """
+        with self.lock:
+            if key not in self.pending:
+                accepted = self.random.random() < self.accepted_rate
+                self.pending[key] = self.accepted_retries if accepted else 0
+            if self.pending[key] > 0:
+                self.pending[key] -= 1
+                return True
+            del self.pending[key]
+            return False
+
+    def entity_page(self, level, limit, offset):
+        results = [
+            {
+                "firm_provided_key": f"{level[:-1].upper()}{index:06d}",
+                "entity_id": f"{level}-{index}",
+            }
+            for index in range(offset, min(offset + limit, self.entities))
+        ]
+        return {"count": self.entities, "results": results}
+
+    def nav_history(self, entity_id, payload):
+        """
+        Synthetic monthly NAV history in chart table format. Values are
+        seeded by the entity ID, so repeated calls return the same numbers.
+        """
+        options = payload.get("options", {})
+        settings = payload.get("settings", {})
+        end_date = pd.Timestamp(settings.get("date", {}).get("date", date.today()))
+        date_range = options.get("date_range", {})
+        if date_range.get("value") == "custom":
+            start_date = pd.Timestamp(date_range["start_date"])
+        else:
+            start_date = end_date - pd.offsets.MonthEnd(self.months)
+        dates = pd.date_range(start_date, end_date, freq=pd.offsets.MonthEnd())
+
+        rng = random.Random(zlib.crc32(str(entity_id).encode()))
+        market_value = rng.uniform(1e5, 1e7)
+        cumulative = 1.0
+        items = []
+        for dte in dates:
+            net_deposits = rng.choice([0, 0, 0, rng.uniform(-1e4, 1e5)])
+            fees = -abs(market_value) * 0.0008
+            expenses = -abs(market_value) * 0.0001
+            gain = market_value * rng.gauss(0.005, 0.03)
+            period_return = gain / market_value if market_value else 0
+            market_value += net_deposits + gain + fees + expenses
+            cumulative *= 1 + period_return
+            values = [
+                dte.strftime("%Y-%m-%d"),
+                net_deposits,
+                net_deposits + fees + expenses,
+                gain,
+                fees,
+                expenses,
+                market_value,
+                cumulative - 1,
+            ]
+            items.append(
+                {
+                    "data": [
+                        {"category_id": category[0], "value": value}
+                        for category, value in zip(NAV_CATEGORIES, values)
+                    ]
+                }
+            )
+        return {
+            "categories": [
+                {"id": cat_id, "name": name, "value_type": value_type}
+                for cat_id, name, value_type in NAV_CATEGORIES
+            ],
+            "items": items,
+        }
+
+
+class MockCalcHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def mock(self) -> MockCalcServer:
+        return self.server.mock
+
+    def send_json(self, status, body=None):
+        content = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def route(self):
+        parts = [part for part in urlparse(self.path).path.split("/") if part]
+        if parts[:2] == ["api", "v1"]:
+            parts = parts[2:]
+        return parts
+
+    def do_GET(self):
+        parts = self.route()
+        if len(parts) == 2 and parts[0] == "data":
+            query = parse_qs(urlparse(self.path).query)
+            limit = int(query.get("limit", [1000])[0])
+            offset = int(query.get("offset", [0])[0])
+            self.send_json(200, self.mock.entity_page(parts[1], limit, offset))
+        else:
+            self.send_json(404, {"detail": "Not found"})
+
+    def do_POST(self):
+        parts = self.route()
+        payload = self.read_json()
+        if parts == ["auth", "login"]:
+            self.send_json(200, {"token": "mock-token"})
+        elif parts == ["auth", "login", "refresh"]:
+            self.send_json(200, {"token": "mock-token"})
+        elif parts == ["calc", "net-asset-value-history"]:
+            self.calc(payload)
+        else:
+            self.send_json(404, {"detail": "Not found"})
+
+    def calc(self, payload):
+        selected = payload.get("control", {}).get("selected_entities", {})
+        entity_id = next(
+            (
+                value[0][0] if isinstance(value[0], list) else value[0]
+                for value in selected.values()
+                if value
+            ),
+            None,
+        )
+        if self.mock.is_accepted(json.dumps(payload, sort_keys=True)):
+            self.send_json(202)
+            return
+        time.sleep(self.mock.latency())
+        if self.mock.draw() < self.mock.error_rate:
+            self.send_json(500, {"detail": "Synthetic calc failure"})
+            return
+        self.send_json(200, self.mock.nav_history(entity_id, payload))
+
+
+def add_mock_args(parser):
+    parser.add_argument(
+        "-mp",
+        "--mock_port",
+        dest="mock_port",
+        type=int,
+        default=8765,
+        help="Port of the mock server",
+    )
+    parser.add_argument(
+        "-me",
+        "--mock_entities",
+        dest="mock_entities",
+        type=int,
+        default=1000,
+        help="Number of entities served by the mock server",
+    )
+    parser.add_argument(
+        "-mm",
+        "--mock_months",
+        dest="mock_months",
+        type=int,
+        default=120,
+        help="Months of history in each since inception calc",
+    )
+    parser.add_argument(
+        "-lm",
+        "--latency_median",
+        dest="latency_median",
+        type=float,
+        default=0.5,
+        help="Median calc latency in seconds",
+    )
+    parser.add_argument(
+        "-ls",
+        "--latency_sigma",
+        dest="latency_sigma",
+        type=float,
+        default=0.5,
+        help="Sigma of the lognormal calc latency",
+    )
+    parser.add_argument(
+        "-ar",
+        "--accepted_rate",
+        dest="accepted_rate",
+        type=float,
+        default=0.0,
+        help="Share of calcs answering 202 before returning data",
+    )
+    parser.add_argument(
+        "-er",
+        "--error_rate",
+        dest="error_rate",
+        type=float,
+        default=0.0,
+        help="Share of calcs failing with a 500",
+    )
+    parser.add_argument(
+        "-sd",
+        "--seed",
+        dest="seed",
+        type=int,
+        default=None,
+        help="Random seed for latencies, 202s and errors",
+    )
+
+
+def mock_from_args(args):
+    return MockCalcServer(
+        port=args.mock_port,
+        entities=args.mock_entities,
+        months=args.mock_months,
+        latency_median=args.latency_median,
+        latency_sigma=args.latency_sigma,
+        accepted_rate=args.accepted_rate,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_mock_args(parser)
+    mock = mock_from_args(parser.parse_args())
+    try:
+        mock.httpd.serve_forever()
+    except KeyboardInterrupt:
+        mock.stop()
@@ -1,10 +1,25 @@
 # import logging
+from itertools import combinations
 import os
+import tempfile
+import zlib
+from datetime import datetime
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
 from base_main import BaseMain
-from utils import logger_setup, NoResponseError, ChartTableFormatter
+from utils import (
+    logger_setup,
+    NoResponseError,
+    ChartTableFormatter,
+    InputValidationError,
+)
+from tolerance import ToleranceEngine, ToleranceResult
+from break_stats import BreakCube
+from content_hash import identical_files
+from top_breaks import TopBreaks
+from recon_store import ReconStore, add_store_args
 
 logger = logger_setup("logs", "gresham_recon")
 
@@ -13,6 +28,38 @@ class NAVRegression(BaseMain):
 
     def __init__(self):
         BaseMain.__init__(self)
+        self.tolerance_result = None
+        self.identical = {}
+        self.store = None
+        self.run_id = None
+        if not self.args.versions and not all(
+            [
+                self.args.base_env,
+                self.args.target_env,
+                self.args.base_version,
+                self.args.target_version,
+            ]
+        ):
+            raise InputValidationError(
+                "Either --versions or the base and target environments and versions are required"
+            )
+        if self.args.top_k_only and not self.args.top_k:
+            raise InputValidationError("--top_k_only requires --top_k")
+        if self.args.versions:
+            unsupported = [
+                flag
+                for flag, value in [
+                    ("--out_of_core", self.args.out_of_core),
+                    ("--top_k", self.args.top_k),
+                    ("--results_db", self.args.results_db),
+                    ("--skip_identical", self.args.skip_identical),
+                ]
+                if value
+            ]
+            if unsupported:
+                raise InputValidationError(
+                    f"{', '.join(unsupported)} not supported with --versions"
+                )
 
     def add_extra_args(self):
         self.parser.add_argument(
@@ -30,7 +77,7 @@ class NAVRegression(BaseMain):
             "--base_env",
             dest="base_env",
             type=str,
-            required=True,
+            required=False,
             help="Base environment name (either client name or a greek)",
         )
 
@@ -39,7 +86,7 @@ class NAVRegression(BaseMain):
             "--target_env",
             dest="target_env",
             type=str,
-            required=True,
+            required=False,
             help="Target environment name (either client name or a greek)",
         )
 
@@ -48,7 +95,7 @@ class NAVRegression(BaseMain):
             "--base_version",
             dest="base_version",
             type=str,
-            required=True,
+            required=False,
             help="Base version (e.g., v5.0, v5.1, etc.)",
         )
 
@@ -57,20 +104,192 @@ class NAVRegression(BaseMain):
             "--target_version",
             dest="target_version",
             type=str,
-            required=True,
+            required=False,
             help="Target version (e.g., v5.0, v5.1, etc.)",
         )
 
+        self.parser.add_argument(
+            "-tol",
+            "--tolerance",
+            dest="tolerance",
+            type=str,
+            default="0.01,Total Return=0.0001",
+            required=False,
+            help="Tolerances, e.g. '0.01,Total Return=0.0001' or 'Gain=1+0.1%%'",
+        )
+
+        self.parser.add_argument(
+            "-ooc",
+            "--out_of_core",
+            dest="out_of_core",
+            action="store_true",
+            default=False,
+            required=False,
+            help="Partition both environments on disk and compare them chunk by chunk",
+        )
+
+        self.parser.add_argument(
+            "-np",
+            "--partitions",
+            dest="partitions",
+            type=int,
+            default=64,
+            required=False,
+            help="Number of on-disk partitions used by --out_of_core",
+        )
+
+        self.parser.add_argument(
+            "-cs",
+            "--chunk_size",
+            dest="chunk_size",
+            type=int,
+            default=100000,
+            required=False,
+            help="Rows read at once from each input file by --out_of_core",
+        )
+
+        self.parser.add_argument(
+            "-si",
+            "--skip_identical",
+            dest="skip_identical",
+            action="store_true",
+            default=False,
+            required=False,
+            help="Skip entity files with the same content in both environments",
+        )
+
+        self.parser.add_argument(
+            "-tk",
+            "--top_k",
+            dest="top_k",
+            type=int,
+            default=None,
+            required=False,
+            help="Write a report of the K largest breaks per metric",
+        )
+
+        self.parser.add_argument(
+            "-tko",
+            "--top_k_only",
+            dest="top_k_only",
+            action="store_true",
+            default=False,
+            required=False,
+            help="Write the top K report instead of the full reconciliation file",
+        )
+
+        add_store_args(self.parser)
+
+        self.parser.add_argument(
+            "-vs",
+            "--versions",
+            dest="versions",
+            type=str,
+            nargs="+",
+            default=None,
+            required=False,
+            help="N-way comparison of env=version pairs, e.g. alpha=v5.0 beta=v5.1 gamma=v5.2",
+        )
+
+        self.parser.add_argument(
+            "-ref",
+            "--reference",
+            dest="reference",
+            type=str,
+            default=None,
+            required=False,
+            help="Compare every version of --versions to this one instead of pairwise",
+        )
+
+    @property
+    def output_name(self):
+        return f"{self.args.base_env}_{self.args.base_version}_{self.args.target_env}_{self.args.target_version}_{self.args.level}"
+
+    def env_folder(self, env):
+        return f"OA_recon/outputs/{env}/{self.args.level}"
+
+    def find_identical(self):
+        """
+        Content hash pre-pass: entity files identical in both environments are
+        read from the base environment only and reported as reconciled,
+        without being compared.
+        :return: number of entity files left to compare
+        """
+        files = {
+            file
+            for env in [self.args.base_env, self.args.target_env]
+            for file in os.listdir(self.env_folder(env))
+            if ".csv" in file and "concatenated" not in file
+        }
+        self.identical = identical_files(
+            self.env_folder(self.args.base_env),
+            self.env_folder(self.args.target_env),
+            sorted(files),
+        )
+        logger.info(
+            f"{len(self.identical)}/{len(files)} entities identical in both environments "
+            f"({sum(self.identical.values())} rows), reported as reconciled"
+        )
+        return len(files) - len(self.identical)
+
+    def identical_recon(self, file, cols, **kwargs):
+        """
+        Recon rows of an entity identical in both environments, built from the
+        base file alone: both versions get its values and every diff is zero.
+        :return: (recon, ToleranceResult)
+        """
+        data = pd.read_csv(
+            os.path.join(self.env_folder(self.args.base_env), file), **kwargs
+        ).fillna(0)
+        metrics = list(cols[2:])
+        recon = data[["Date", "Entity ID"]].copy()
+        for metric in metrics:
+            recon[f"{metric} - {self.args.base_version}"] = data[metric]
+            recon[f"{metric} - {self.args.target_version}"] = data[metric]
+        shape = (len(recon), len(metrics))
+        result = ToleranceResult(
+            metrics, np.zeros(shape), np.zeros(shape), np.ones(shape, dtype=bool)
+        )
+        result.assign(recon, absolute=False)
+        return recon[self.return_columns(cols)], result
+
+    @staticmethod
+    def combine_recons(parts):
+        """
+        Stack (recon, ToleranceResult) parts, sorted on (Date, Entity ID) as
+        the outer merge of compare_frames sorts them.
+        """
+        if len(parts) == 1:
+            return parts[0]
+        recon = pd.concat([part[0] for part in parts], ignore_index=True)
+        order = recon.sort_values(["Date", "Entity ID"], kind="stable").index
+        results = [part[1] for part in parts]
+        result = ToleranceResult(
+            results[0].metrics,
+            np.vstack([result.diff for result in results])[order],
+            np.vstack([result.abs_diff for result in results])[order],
+            np.vstack([result.reconciled for result in results])[order],
+        )
+        return recon.loc[order].reset_index(drop=True), result
+
     def read_files(self, env, lvl):
         folder = f"OA_recon/outputs/{env}/{lvl}"
-        files = [file for file in os.listdir(folder) if ".csv" in file]
+        files = [
+            file
+            for file in os.listdir(folder)
+            if ".csv" in file and "concatenated" not in file
+        ]
         if not files:
             raise NoResponseError(f"No CSV files found in {folder}")
 
         dataframes = []
         for file in files:
+            if file in self.identical:
+                continue
             df = pd.read_csv(os.path.join(folder, file))
             dataframes.append(df)
+        if not dataframes:
+            return pd.read_csv(os.path.join(folder, files[0]), nrows=0)
         combined_df = pd.concat(dataframes, ignore_index=True)
         return combined_df
 
@@ -87,14 +306,7 @@ class NAVRegression(BaseMain):
                 base_cols.append(f"{col} - {suffix}")
         return base_cols
 
-    def compare_versions(self):
-        base_data = self.read_files(self.args.base_env, self.args.level)
-        target_data = self.read_files(self.args.target_env, self.args.level)
-        cols = base_data.columns
-        if base_data.empty or target_data.empty:
-            raise NoResponseError(
-                "One of the datasets is empty. Cannot perform comparison."
-            )
+    def compare_frames(self, base_data, target_data, cols):
         comparison = pd.merge(
             base_data,
             target_data,
@@ -103,23 +315,247 @@ class NAVRegression(BaseMain):
             how="outer",
         ).fillna(0)
 
-        for col in cols[2:]:
-            comparison[f"{col} - Diff"] = (
-                comparison[f"{col} - {self.args.target_version}"]
-                - comparison[f"{col} - {self.args.base_version}"]
-            )
-            comparison[f"{col} - Reconciled"] = abs(comparison[f"{col} - Diff"]) < 0.01
-        comparison["Total Return - Reconciled"] = (
-            abs(comparison["Total Return - Diff"]) < 0.0001
+        result = ToleranceEngine.from_string(self.args.tolerance).compare_frame(
+            comparison,
+            list(cols[2:]),
+            f"{{}} - {self.args.target_version}",
+            f"{{}} - {self.args.base_version}",
         )
+        result.assign(comparison, absolute=False)
         comparison = comparison[self.return_columns(cols)]
+        return comparison, result
+
+    def compare_versions(self):
+        base_data = self.read_files(self.args.base_env, self.args.level)
+        target_data = self.read_files(self.args.target_env, self.args.level)
+        cols = base_data.columns
+        parts = [self.identical_recon(file, cols) for file in sorted(self.identical)]
+        if not (parts and base_data.empty and target_data.empty):
+            if base_data.empty or target_data.empty:
+                raise NoResponseError(
+                    "One of the datasets is empty. Cannot perform comparison."
+                )
+            parts.insert(0, self.compare_frames(base_data, target_data, cols))
+        comparison, self.tolerance_result = self.combine_recons(parts)
         return comparison
 
+    def partition_environment(self, env, partition_folder):
+        """
+        Split an environment into hash partitions of Entity ID on disk, reading
+        each input file in chunks. All rows of an entity land in the same
+        partition on both sides. Returns the input columns.
+        """
+        folder = self.env_folder(env)
+        files = [
+            file
+            for file in os.listdir(folder)
+            if ".csv" in file and "concatenated" not in file
+        ]
+        if not files:
+            raise NoResponseError(f"No CSV files found in {folder}")
+
+        os.makedirs(partition_folder, exist_ok=True)
+        cols = pd.read_csv(os.path.join(folder, files[0]), nrows=0).columns
+        for file in files:
+            if file in self.identical:
+                continue
+            for chunk in pd.read_csv(
+                os.path.join(folder, file),
+                chunksize=self.args.chunk_size,
+                dtype={"Entity ID": str},
+            ):
+                partitions = {
+                    entity_id: zlib.crc32(entity_id.encode()) % self.args.partitions
+                    for entity_id in chunk["Entity ID"].unique()
+                }
+                for partition, rows in chunk.groupby(
+                    chunk["Entity ID"].map(partitions)
+                ):
+                    self.append_csv(
+                        rows, os.path.join(partition_folder, f"part_{partition}.csv")
+                    )
+        return cols
+
+    @staticmethod
+    def append_csv(df, file_path):
+        df.to_csv(
+            file_path, mode="a", header=not os.path.exists(file_path), index=False
+        )
+
+    @staticmethod
+    def read_partition(file_path, cols):
+        if os.path.exists(file_path):
+            return pd.read_csv(file_path, dtype={"Entity ID": str})
+        return pd.DataFrame(columns=cols)
+
+    def compare_out_of_core(self, output_folder):
+        """
+        Bounded memory version of compare_versions: both sides are hash
+        partitioned on disk, then each pair of partitions is merged and its
+        recon, filtered and break cube rows are appended to the outputs.
+        Rows are grouped by partition instead of globally sorted, and the
+        entities identical in both environments come last.
+        """
+        outputs = {
+            kind: os.path.join(output_folder, f"{kind}_{self.output_name}.csv")
+            for kind in ["reconciliation", "filtered_reconciliation", "break_cube"]
+        }
+        for file_path in outputs.values():
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+        entity_breaks = []
+        with tempfile.TemporaryDirectory() as tmp:
+            base_folder = os.path.join(tmp, "base")
+            target_folder = os.path.join(tmp, "target")
+            cols = self.partition_environment(self.args.base_env, base_folder)
+            self.partition_environment(self.args.target_env, target_folder)
+            break_cube = BreakCube(["Entity ID", "Date"], list(cols[2:]))
+            top_breaks = self.top_breaks(list(cols[2:]))
+            self.start_store_run()
+
+            for partition in range(self.args.partitions):
+                file_name = f"part_{partition}.csv"
+                base_data = self.read_partition(
+                    os.path.join(base_folder, file_name), cols
+                )
+                target_data = self.read_partition(
+                    os.path.join(target_folder, file_name), cols
+                )
+                if base_data.empty and target_data.empty:
+                    continue
+                comparison, result = self.compare_frames(base_data, target_data, cols)
+                entity_breaks.append(
+                    self.append_outputs(
+                        outputs, comparison, result, break_cube, top_breaks
+                    )
+                )
+                logger.info(
+                    f"Partition {partition + 1}/{self.args.partitions} compared"
+                )
+            for file in sorted(self.identical):
+                comparison, result = self.identical_recon(
+                    file, cols, dtype={"Entity ID": str}
+                )
+                entity_breaks.append(
+                    self.append_outputs(
+                        outputs, comparison, result, break_cube, top_breaks
+                    )
+                )
+
+        if not entity_breaks:
+            raise NoResponseError("No data to compare. Please check the input files.")
+        entity_breaks = pd.concat(entity_breaks, ignore_index=True)
+        value_cols = entity_breaks.columns[3:]
+        total = (
+            entity_breaks[value_cols]
+            .sum()
+            .to_frame()
+            .T.astype(entity_breaks[value_cols].dtypes)
+        )
+        total.insert(0, "Date", BreakCube.TOTAL)
+        total.insert(0, "Entity ID", BreakCube.TOTAL)
+        total.insert(0, "Level", "Total")
+        self.append_csv(total, outputs["break_cube"])
+        self.save_top_breaks(top_breaks, output_folder)
+        self.close_store()
+        logger.info(f"Reconciliation completed. Results saved to {output_folder}.")
+
+    def append_outputs(self, outputs, comparison, result, break_cube, top_breaks):
+        """
+        Append the recon, filtered and break cube rows of one chunk of
+        compare_out_of_core.
+        :return: entity level rows of the chunk's break cube
+        """
+        if not self.args.top_k_only:
+            self.append_csv(comparison, outputs["reconciliation"])
+        self.update_top_breaks(top_breaks, comparison, result)
+        self.store_results(comparison, result.metrics)
+        self.append_csv(comparison[result.breaks()], outputs["filtered_reconciliation"])
+        cube = break_cube.build(comparison, ~result.reconciled, result.abs_diff)
+        self.append_csv(cube[cube["Level"] != "Total"], outputs["break_cube"])
+        return cube[cube["Level"] == "Entity ID"]
+
+    def top_breaks(self, metrics):
+        if not self.args.top_k:
+            return None
+        return TopBreaks(
+            metrics,
+            self.args.top_k,
+            labels=[self.args.target_version, self.args.base_version],
+        )
+
+    def update_top_breaks(self, top_breaks, comparison, result):
+        if top_breaks is None:
+            return
+        top_breaks.update(
+            comparison[["Entity ID", "Date"]],
+            result,
+            comparison[
+                [f"{metric} - {self.args.target_version}" for metric in result.metrics]
+            ],
+            comparison[
+                [f"{metric} - {self.args.base_version}" for metric in result.metrics]
+            ],
+        )
+
+    def save_top_breaks(self, top_breaks, output_folder):
+        if top_breaks is None:
+            return
+        top_breaks.report().to_csv(
+            os.path.join(output_folder, f"top_breaks_{self.output_name}.csv"),
+            index=False,
+        )
+
+    def start_store_run(self):
+        if not self.args.results_db:
+            return
+        self.store = ReconStore(self.args.results_db)
+        self.run_id = self.store.start_run(
+            "nav_regression",
+            self.output_name,
+            self.args.target_version,
+            self.args.base_version,
+            datetime.today().strftime("%Y-%m-%d"),
+        )
+
+    def store_results(self, comparison, metrics):
+        if self.store is None:
+            return
+        self.store.ingest_frame(
+            self.run_id,
+            comparison,
+            metrics,
+            f"{{}} - {self.args.target_version}",
+            f"{{}} - {self.args.base_version}",
+            entity_id="Entity ID",
+        )
+
+    def close_store(self):
+        if self.store is None:
+            return
+        self.store.close()
+        logger.info(f"Results saved to {self.args.results_db} (run {self.run_id})")
+
+    def break_statistics(self, recon):
+        """
+        Break counts and sums per entity and date, rolled up to entity and
+        grand total, from the tolerance check of compare_versions or
+        compare_matrix.
+        """
+        result = self.tolerance_result
+        return BreakCube(["Entity ID", "Date"], result.metrics).build(
+            recon, ~result.reconciled, result.abs_diff
+        )
+
     def filter_recon(self, recon):
         if recon.empty:
             logger.error("No data to filter. Please check the input files.")
             return recon
-        filtered_recon = recon[~recon.filter(like="Reconciled").all(axis=1)]
+        if self.tolerance_result is not None:
+            filtered_recon = recon[self.tolerance_result.breaks()]
+        else:
+            filtered_recon = recon[~recon.filter(like="Reconciled").all(axis=1)]
         if filtered_recon.empty:
             logger.warning("Data is fully reconciled. No discrepancies found.")
         else:
@@ -128,19 +564,133 @@ class NAVRegression(BaseMain):
             )
         return filtered_recon
 
+    @property
+    def versions(self):
+        versions = dict(
+            reversed(item.split("=", 1)) for item in self.args.versions or []
+        )
+        if len(versions) != len(self.args.versions or []):
+            raise InputValidationError("Each version can only be given once")
+        if self.args.reference and self.args.reference not in versions:
+            raise InputValidationError(
+                f"Reference {self.args.reference} is not one of the versions"
+            )
+        return versions
+
+    @property
+    def version_pairs(self):
+        """(base, target) version pairs, in the order given on the command line."""
+        versions = list(self.versions)
+        if self.args.reference:
+            return [
+                (self.args.reference, version)
+                for version in versions
+                if version != self.args.reference
+            ]
+        return list(combinations(versions, 2))
+
+    def load_versions(self):
+        """
+        Read every environment once and align them on (Date, Entity ID), with
+        one (version, metric) column per version and metric.
+        :return: (aligned versions, metrics)
+        """
+        frames = {}
+        for version, env in self.versions.items():
+            frames[version] = self.read_files(env, self.args.level).set_index(
+                ["Date", "Entity ID"]
+            )
+            if frames[version].empty:
+                raise NoResponseError(f"No data for {env} {version}.")
+        metrics = list(next(iter(frames.values())).columns)
+        return pd.concat(frames, axis=1, join="outer").fillna(0), metrics
+
+    def compare_matrix(self):
+        """
+        Diff and reconciled columns for every version pair, from a single
+        aligned frame. Diffs are target - base, as in compare_versions.
+        :return: (recon, ToleranceResult over '{metric} - {target} vs {base}')
+        """
+        aligned, metrics = self.load_versions()
+        engine = ToleranceEngine.from_string(self.args.tolerance)
+        recon = aligned.index.to_frame(index=False)
+        for version in self.versions:
+            for metric in metrics:
+                recon[f"{metric} - {version}"] = aligned[(version, metric)].to_numpy()
+
+        pair_metrics, results = [], []
+        for base, target in self.version_pairs:
+            results.append(
+                engine.compare(
+                    metrics,
+                    aligned[target][metrics].to_numpy(),
+                    aligned[base][metrics].to_numpy(),
+                )
+            )
+            pair_metrics += [f"{metric} - {target} vs {base}" for metric in metrics]
+        result = ToleranceResult(
+            pair_metrics,
+            np.hstack([result.diff for result in results]),
+            np.hstack([result.abs_diff for result in results]),
+            np.hstack([result.reconciled for result in results]),
+        )
+        result.assign(recon, absolute=False)
+
+        columns = ["Date", "Entity ID"]
+        for metric in metrics:
+            columns += [f"{metric} - {version}" for version in self.versions]
+            for base, target in self.version_pairs:
+                name = f"{metric} - {target} vs {base}"
+                columns += [f"{name} - Diff", f"{name} - Reconciled"]
+        return recon[columns], result
+
+    def run_matrix(self, output_folder):
+        recon, self.tolerance_result = self.compare_matrix()
+        name = "_".join(f"{env}_{version}" for version, env in self.versions.items())
+        if self.args.reference:
+            name = f"{name}_vs_{self.args.reference}"
+        name = f"matrix_{name}_{self.args.level}"
+        recon.to_csv(os.path.join(output_folder, f"{name}.csv"), index=False)
+        self.filter_recon(recon).to_csv(
+            os.path.join(output_folder, f"filtered_{name}.csv"), index=False
+        )
+        self.break_statistics(recon).to_csv(
+            os.path.join(output_folder, f"break_cube_{name}.csv"), index=False
+        )
+        logger.info(f"Reconciliation completed. Results saved to {output_folder}.")
+
     def run(self):
+        output_folder = "OA_recon/outputs"
+        if self.args.versions:
+            self.run_matrix(output_folder)
+            return
+        if self.args.skip_identical:
+            self.find_identical()
+        if self.args.out_of_core:
+            self.compare_out_of_core(output_folder)
+            return
         recon = self.compare_versions()
         if recon.empty:
             logger.error("No data to reconcile. Please check the input files.")
             return
-        output_folder = "OA_recon/outputs"
-        output_file = f"reconciliation_{self.args.base_env}_{self.args.base_version}_{self.args.target_env}_{self.args.target_version}_{self.args.level}.csv"
-        recon.to_csv(os.path.join(output_folder, output_file), index=False)
+        if not self.args.top_k_only:
+            output_file = f"reconciliation_{self.output_name}.csv"
+            recon.to_csv(os.path.join(output_folder, output_file), index=False)
+        top_breaks = self.top_breaks(self.tolerance_result.metrics)
+        self.update_top_breaks(top_breaks, recon, self.tolerance_result)
+        self.save_top_breaks(top_breaks, output_folder)
+        self.start_store_run()
+        self.store_results(recon, self.tolerance_result.metrics)
+        self.close_store()
         filtered_recon = self.filter_recon(recon)
-        filtered_output_file = f"filtered_reconciliation_{self.args.base_env}_{self.args.base_version}_{self.args.target_env}_{self.args.target_version}_{self.args.level}.csv"
+        filtered_output_file = f"filtered_reconciliation_{self.output_name}.csv"
         filtered_recon.to_csv(
             os.path.join(output_folder, filtered_output_file), index=False
         )
+        cube_output_file = f"break_cube_{self.output_name}.csv"
+        self.break_statistics(recon).to_csv(
+            os.path.join(output_folder, cube_output_file), index=False
+        )
         logger.info(f"Reconciliation completed. Results saved to {output_folder}.")
 
 
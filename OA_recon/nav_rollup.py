@@ -0,0 +1,218 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from utils import logger_setup, InputValidationError
+
+logger = logger_setup("logs", "nav_rollup")
+
+
+"""
+Rolls up account-level NAV histories downloaded by OADataDownload into
+client and household histories, instead of running one server-side calc
+per client/household.
+
+The necessary inputs to run the code are:
+- Account histories on OA_recon/outputs/<ENV>/accounts (either the per-account
+files or concatenated_accounts.csv)
+- Hierarchy: either a csv passed with --hierarchy_file with columns
+'Account ID', 'Client ID' and 'Household ID' (plus the split column if
+--exclude_split is set), or OA_recon/inputs/Account.csv and
+OA_recon/inputs/Client.csv as exported from the custodian folder.
+
+Flows (Net Deposits, Net Additions, Gain, Fees, Expenses) are period amounts
+and are summed, as is Market Value EoP. Total Return is rebuilt as a
+chain-linked Modified Dietz return with flows assumed mid-period, on the
+opening value of each account period (Market Value EoP - Net Additions - Gain).
+
+Results are written with the same layout as the server downloads to
+OA_recon/outputs/<ENV>_rollup/<LEVEL>, so they can be reconciled against
+the server-side calcs with OARecon or NAVRegression.
+"""
+
+
+class NAVRollup:
+    def __init__(self):
+        self.parser = argparse.ArgumentParser(description=__doc__)
+        self.parser.add_argument(
+            "-e",
+            "--env",
+            dest="env",
+            type=str,
+            required=True,
+            help="Name of the folder with the account level files",
+        )
+        self.parser.add_argument(
+            "-lv",
+            "--level",
+            dest="level",
+            type=str,
+            default="all",
+            choices=["clients", "households", "all"],
+            help="Hierarchy level to roll up to (clients, households or all)",
+        )
+        self.parser.add_argument(
+            "-hf",
+            "--hierarchy_file",
+            dest="hierarchy_file",
+            type=str,
+            required=False,
+            help="CSV mapping Account ID to Client ID and Household ID",
+        )
+        self.parser.add_argument(
+            "-x",
+            "--exclude_split",
+            dest="exclude_split",
+            action="store_true",
+            default=False,
+            help="Exclude 'Split' accounts, as the Gresham filter set does",
+        )
+        self.parser.add_argument(
+            "-sc",
+            "--split_column",
+            dest="split_column",
+            type=str,
+            default="UserDefined1",
+            help="Account property holding the 'Split' flag",
+        )
+        self.args = self.parser.parse_args()
+        self.flow_columns = [
+            "Net Deposits",
+            "Net Additions",
+            "Gain",
+            "Fees",
+            "Expenses",
+            "Market Value EoP",
+        ]
+
+    @property
+    def levels(self):
+        if self.args.level == "all":
+            return ["clients", "households"]
+        return [self.args.level]
+
+    @property
+    def input_folder(self):
+        return f"OA_recon/outputs/{self.args.env}/accounts"
+
+    def output_folder(self, level):
+        return f"OA_recon/outputs/{self.args.env}_rollup/{level}"
+
+    def get_account_histories(self):
+        concatenated = os.path.join(self.input_folder, "concatenated_accounts.csv")
+        if os.path.exists(concatenated):
+            histories = pd.read_csv(concatenated)
+        else:
+            files = [
+                file
+                for file in os.listdir(self.input_folder)
+                if file.endswith(".csv") and "concatenated" not in file
+            ]
+            if not files:
+                raise InputValidationError(f"No account files in {self.input_folder}")
+            histories = pd.concat(
+                [pd.read_csv(os.path.join(self.input_folder, file)) for file in files],
+                ignore_index=True,
+            )
+        return histories[["Date", "Account ID"] + self.flow_columns]
+
+    def get_hierarchy(self):
+        if self.args.hierarchy_file:
+            hierarchy = pd.read_csv(self.args.hierarchy_file)
+        else:
+            usecols = ["AccountCode", "ClientCode"]
+            if self.args.exclude_split:
+                usecols.append(self.args.split_column)
+            accounts = pd.read_csv("OA_recon/inputs/Account.csv", usecols=usecols)
+            clients = pd.read_csv(
+                "OA_recon/inputs/Client.csv", usecols=["ClientID", "HouseholdID"]
+            )
+            hierarchy = (
+                pd.merge(
+                    accounts,
+                    clients,
+                    left_on="ClientCode",
+                    right_on="ClientID",
+                    how="left",
+                )
+                .drop(columns="ClientCode")
+                .rename(
+                    columns={
+                        "AccountCode": "Account ID",
+                        "ClientID": "Client ID",
+                        "HouseholdID": "Household ID",
+                    }
+                )
+            )
+
+        if self.args.exclude_split:
+            split = hierarchy[self.args.split_column] == "Split"
+            logger.info(f"Excluding {split.sum()} Split accounts")
+            hierarchy = hierarchy[~split]
+        return hierarchy[["Account ID", "Client ID", "Household ID"]]
+
+    def rollup(self, histories, hierarchy, level):
+        """
+        Aggregate account histories to a hierarchy level in one groupby and
+        chain-link the flow adjusted period returns per entity.
+        """
+        entity_col = f"{level.capitalize()[:-1]} ID"
+        data = histories.merge(hierarchy, on="Account ID", how="inner")
+        data = data.dropna(subset=[entity_col])
+        # opening value of each account period, so that the first period of an
+        # entity and accounts joining mid-history start from their real value
+        data["Market Value BoP"] = (
+            data["Market Value EoP"] - data["Net Additions"] - data["Gain"]
+        )
+        rolled = (
+            data.groupby([entity_col, "Date"], as_index=False)[
+                self.flow_columns + ["Market Value BoP"]
+            ]
+            .sum()
+            .sort_values([entity_col, "Date"])
+            .reset_index(drop=True)
+        )
+
+        invested = rolled["Market Value BoP"] + rolled["Net Additions"] / 2
+        period_return = pd.Series(
+            np.divide(
+                rolled["Gain"].to_numpy(dtype=float),
+                invested.to_numpy(dtype=float),
+                out=np.zeros(len(rolled)),
+                where=invested.to_numpy() != 0,
+            ),
+            index=rolled.index,
+        )
+        rolled["Total Return"] = (1 + period_return).groupby(
+            rolled[entity_col]
+        ).cumprod() - 1
+        return rolled[["Date", entity_col] + self.flow_columns + ["Total Return"]]
+
+    def save_rollup(self, rolled, level):
+        entity_col = f"{level.capitalize()[:-1]} ID"
+        folder = self.output_folder(level)
+        Path(folder).mkdir(parents=True, exist_ok=True)
+        for entity_id, df in rolled.groupby(entity_col):
+            df.to_csv(os.path.join(folder, f"{entity_id}.csv"), index=False)
+        rolled.to_csv(os.path.join(folder, f"concatenated_{level}.csv"), index=False)
+        logger.info(f"{rolled[entity_col].nunique()} {level} saved to {folder}")
+
+    def run(self):
+        histories = self.get_account_histories()
+        hierarchy = self.get_hierarchy()
+        unmapped = ~histories["Account ID"].isin(hierarchy["Account ID"])
+        if unmapped.any():
+            logger.warning(
+                f"{histories.loc[unmapped, 'Account ID'].nunique()} accounts have no hierarchy mapping"
+            )
+        for level in self.levels:
+            rolled = self.rollup(histories, hierarchy, level)
+            self.save_rollup(rolled, level)
+        logger.info("Done!")
+
+
+if __name__ == "__main__":
+    work = NAVRollup()
+    work.run()
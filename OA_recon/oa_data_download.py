@@ -1,15 +1,117 @@
 # import logging
+import json
 import os
+import time
+from datetime import datetime, timedelta
 import pandas as pd
 from pathlib import Path
-from multiprocess import Pool
+from multiprocess import Pool, TimeoutError
 
 from base_main import BaseMain
-from utils import logger_setup, NoResponseError, ChartTableFormatter
+from utils import logger_setup, NoResponseError, ChartTableFormatter, ProgressTracker
 
 logger = logger_setup("logs", "gresham_recon")
 
 
+class EntityRegistry:
+    """
+    Entity IDs of a server/level pair, loaded once per run and persisted on
+    OA_recon/inputs together with the time they were fetched.
+    Registries are cached at class level, keyed by (server, level), so they
+    are not copied into every pickled worker task.
+    """
+
+    _registries = {}
+
+    def __init__(self, server_name, level):
+        self.server_name = server_name
+        self.level = level
+        self.entities = None
+        self.fetched_at = None
+        self.filtered = None
+
+    @classmethod
+    def get(cls, server_name, level):
+        key = (server_name, level)
+        if key not in cls._registries:
+            cls._registries[key] = cls(server_name, level)
+        return cls._registries[key]
+
+    @property
+    def loaded(self):
+        return self.entities is not None
+
+    @property
+    def csv_file(self):
+        return f"OA_recon/inputs/{self.server_name}_{self.level}_entity_ids.csv"
+
+    @property
+    def meta_file(self):
+        return f"OA_recon/inputs/{self.server_name}_{self.level}_entity_ids.json"
+
+    def is_stale(self, max_age_hours):
+        if max_age_hours is None:
+            return False
+        return datetime.now() - self.fetched_at > timedelta(hours=max_age_hours)
+
+    def load(self, fetch, max_age_hours=None):
+        """
+        Read the stored registry, or fetch it if there is none.
+        :param fetch: callable returning the entities from a given offset
+        :param max_age_hours: refresh the registry if older than this
+        """
+        if os.path.exists(self.csv_file):
+            self.entities = pd.read_csv(self.csv_file)
+            if os.path.exists(self.meta_file):
+                with open(self.meta_file) as f:
+                    self.fetched_at = datetime.fromisoformat(json.load(f)["fetched_at"])
+            else:
+                self.fetched_at = datetime.fromtimestamp(
+                    os.path.getmtime(self.csv_file)
+                )
+            if self.is_stale(max_age_hours):
+                self.refresh(fetch)
+        else:
+            self.entities = fetch()
+            self.fetched_at = datetime.now()
+            self.save()
+        self.filtered = self.entities
+
+    def refresh(self, fetch):
+        """
+        Incremental refresh: only the pages past the stored entries are
+        downloaded, as new entities are appended to the end of the list.
+        """
+        new_entities = fetch(offset=len(self.entities))
+        logger.info(f"Registry refresh found {len(new_entities)} new {self.level}")
+        self.entities = (
+            pd.concat([self.entities, new_entities], ignore_index=True)
+            .drop_duplicates(subset="entity_id", keep="last")
+            .reset_index(drop=True)
+        )
+        self.fetched_at = datetime.now()
+        self.save()
+
+    def save(self):
+        self.entities.to_csv(self.csv_file, index=False)
+        with open(self.meta_file, "w") as f:
+            json.dump(
+                {
+                    "server": self.server_name,
+                    "level": self.level,
+                    "fetched_at": self.fetched_at.isoformat(),
+                    "count": len(self.entities),
+                },
+                f,
+                indent=4,
+            )
+
+    def apply_filter(self, keys):
+        """Keep only the entities whose firm provided key is in `keys`."""
+        if keys:
+            self.filtered = self.entities[self.entities["firm_provided_key"].isin(keys)]
+
+
 class OADataDownload(BaseMain):
 
     def __init__(self):
@@ -55,11 +157,59 @@ class OADataDownload(BaseMain):
             help="Filter the entity IDs based on VNF data",
         )
 
+        self.parser.add_argument(
+            "-i",
+            "--incremental",
+            dest="incremental",
+            action="store_true",
+            default=False,
+            required=False,
+            help="Only download the months missing from the stored history",
+        )
+
+        self.parser.add_argument(
+            "-o",
+            "--overlap",
+            dest="overlap",
+            default=3,
+            type=int,
+            required=False,
+            help="Months re-downloaded before the last stored date on incremental runs",
+        )
+
+        self.parser.add_argument(
+            "-pi",
+            "--progress_interval",
+            dest="progress_interval",
+            default=60,
+            type=int,
+            required=False,
+            help="Seconds between two progress reports",
+        )
+
+        self.parser.add_argument(
+            "-ra",
+            "--registry_max_age",
+            dest="registry_max_age",
+            default=None,
+            type=float,
+            required=False,
+            help="Refresh the stored entity IDs when older than this many hours",
+        )
+
+        self.parser.add_argument(
+            "-w",
+            "--workers",
+            dest="workers",
+            default=None,
+            type=int,
+            required=False,
+            help="Number of download processes (defaults to the number of CPUs)",
+        )
+
     def create_output_folder(self) -> None:
         try:
-            server_name = self.args.server.replace("https://api-", "").split(".")[0]
-            folder = f"OA_recon/outputs/{server_name}/{self.args.level}"
-            folder_path = Path(folder)
+            folder_path = Path(self.output_folder)
             folder_path.mkdir(parents=True, exist_ok=True)
             print("Output folder created")
         except PermissionError as e:
@@ -67,15 +217,31 @@ class OADataDownload(BaseMain):
         except Exception as e:
             print(f"An error occurred: {e}")
 
+    @property
+    def server_name(self):
+        return self.args.server.replace("https://api-", "").split(".")[0]
+
     @property
     def output_folder(self):
-        server_name = self.args.server.replace("https://api-", "").split(".")[0]
-        return f"OA_recon/outputs/{server_name}/{self.args.level}"
+        return f"OA_recon/outputs/{self.server_name}/{self.args.level}"
+
+    @property
+    def entity_id_col(self):
+        return f"{self.args.level.capitalize()[:(-1)]} ID"
 
     @property
-    def input_file(self):
-        server_name = self.args.server.replace("https://api-", "").split(".")[0]
-        return f"{server_name}_{self.args.level}_entity_ids.csv"
+    def restated_file(self):
+        return os.path.join(
+            os.path.dirname(self.output_folder),
+            f"restated_{self.args.level}_{self.args.report_date}.csv",
+        )
+
+    @property
+    def summary_file(self):
+        return os.path.join(
+            os.path.dirname(self.output_folder),
+            f"download_summary_{self.args.level}_{self.args.report_date}.json",
+        )
 
     @property
     def payload(self):
@@ -119,21 +285,20 @@ class OADataDownload(BaseMain):
         vnf_entities = f"vnf_{self.args.level}.csv"
         if vnf_entities in os.listdir("OA_recon/inputs") and self.args.filter:
             vnf_data = pd.read_csv(f"OA_recon/inputs/{vnf_entities}")
-            return vnf_data["Portfolio Firm Provided Key"].unique().tolist()
+            return frozenset(vnf_data["Portfolio Firm Provided Key"].unique())
         return None
 
     @property
-    def entity_ids(self) -> pd.DataFrame:
-        if self.input_file in os.listdir("OA_recon/inputs"):
-            entities = pd.read_csv(f"OA_recon/inputs/{self.input_file}")
-        else:
-            entities = self.get_entity_data()
-            entities.to_csv(f"OA_recon/inputs/{self.input_file}", index=False)
-
-        if self.vnf_entities:
-            entities = entities[entities["firm_provided_key"].isin(self.vnf_entities)]
+    def registry(self) -> EntityRegistry:
+        registry = EntityRegistry.get(self.server_name, self.args.level)
+        if not registry.loaded:
+            registry.load(self.get_entity_data, self.args.registry_max_age)
+            registry.apply_filter(self.vnf_entities)
+        return registry
 
-        return entities
+    @property
+    def entity_ids(self) -> pd.DataFrame:
+        return self.registry.filtered
 
     def get_calculation(self, calc_type: str, payload: dict):
         calc_call = self.api.calc(calc_type)
@@ -142,18 +307,20 @@ class OADataDownload(BaseMain):
             raise NoResponseError("Request returned no result!")
         return response
 
-    def get_entity_data(self, batch_size=1000):
+    def get_entity_data(self, batch_size=1000, offset=0):
         api_call = self.api.data
         api_call._store["base_url"] += f"{self.args.level}/"
-        response = api_call.get(extra=f"limit={batch_size}")
+        response = api_call.get(extra=f"limit={batch_size}&offset={offset}")
 
         if response:
             response_list = []
             total_entries = response["count"]
             print(f"Total number of entries: {total_entries}")
-            df = pd.DataFrame(response["results"])
+            df = pd.DataFrame(
+                response["results"], columns=["firm_provided_key", "entity_id"]
+            )
             response_list.append(df)
-            total_downloaded = min(batch_size, df.shape[0])
+            total_downloaded = offset + min(batch_size, df.shape[0])
             print(f"Downloaded: {total_downloaded} entries")
 
             while total_downloaded < total_entries:
@@ -171,6 +338,73 @@ class OADataDownload(BaseMain):
         else:
             raise NoResponseError
 
+    def history_window_start(self, firm_provided_key: str):
+        """
+        Start date of the incremental window for an entity: the first day of
+        the month following its last complete stored month, moved back by
+        --overlap months. None if nothing is stored.
+
+        The custom start date is inclusive, so starting on a month end would
+        make the first period returned a one-day stub; starting on the first
+        day of a month makes it a full month, ending on that month's end.
+        """
+        file_path = os.path.join(self.output_folder, f"{firm_provided_key}.csv")
+        if not os.path.exists(file_path):
+            return None
+        stored_dates = pd.to_datetime(pd.read_csv(file_path, usecols=["Date"])["Date"])
+        if stored_dates.empty:
+            return None
+        # a partial last month (a mid-month report date) is always downloaded again
+        first_month = (stored_dates.max() + pd.offsets.Day(1)).to_period("M")
+        return (first_month - self.args.overlap).start_time
+
+    def splice_history(self, firm_provided_key: str, fresh, window_start):
+        """
+        Replace the stored rows from window_start onwards with the freshly
+        downloaded ones. window_start is the first day of a month, so the
+        splice and the comparison start at that month's end, the first period
+        downloaded. Returns the overlap rows whose values changed
+        (restatements), or None if nothing changed.
+        """
+        file_path = os.path.join(self.output_folder, f"{firm_provided_key}.csv")
+        stored = pd.read_csv(file_path)
+        stored["Date"] = pd.to_datetime(stored["Date"])
+        fresh["Date"] = pd.to_datetime(fresh["Date"])
+
+        overlap = stored[stored["Date"] >= window_start]
+        history = pd.concat(
+            [stored[stored["Date"] < window_start], fresh], ignore_index=True
+        ).sort_values("Date")
+        history.to_csv(file_path, index=False)
+
+        value_cols = [
+            col
+            for col in fresh.select_dtypes("number").columns
+            if col in overlap.columns
+        ]
+        compared = overlap.merge(
+            fresh,
+            on=[self.entity_id_col, "Date"],
+            suffixes=[" - Stored", " - Downloaded"],
+        )
+        restated = pd.Series(False, index=compared.index)
+        for col in value_cols:
+            restated |= (
+                round(
+                    abs(compared[f"{col} - Stored"] - compared[f"{col} - Downloaded"]),
+                    4,
+                )
+                > 0
+            )
+        if not restated.any():
+            return None
+        logger.warning(
+            f"{restated.sum()} restated rows for {self.args.level[:(-1)]} {firm_provided_key}"
+        )
+        compared = compared[restated]
+        compared.insert(2, "Restated", True)
+        return compared
+
     def run_calc(self, firm_provided_key: str, entity_id: str):
         payload = self.payload
         if self.args.level == "accounts":
@@ -185,39 +419,102 @@ class OADataDownload(BaseMain):
             payload["control"]["selected_entities"] = {"households": [entity_id]}
             if self.args.server == "https://api-gresham.d1g1t.com":
                 payload["filter_sets"][0]["entities"] = [entity_id]
+
+        window_start = None
+        if self.args.incremental:
+            window_start = self.history_window_start(firm_provided_key)
+        if window_start is not None:
+            payload["options"]["date_range"] = {
+                "value": "custom",
+                "label": "Custom",
+                "start_date": window_start.strftime("%Y-%m-%d"),
+                "end_date": self.args.report_date,
+            }
+
         filename = f"{firm_provided_key}.csv"
+        resp = self.get_calculation("net-asset-value-history", payload)
+        parser = ChartTableFormatter(resp, payload)
+        res = parser.parse_data()
+        logger.info(f"Download OK for {self.args.level[:(-1)]} {firm_provided_key}")
+        res.insert(1, self.entity_id_col, firm_provided_key)
+        if window_start is not None:
+            return self.splice_history(firm_provided_key, res, window_start)
+        res.to_csv(os.path.join(self.output_folder, filename), index=False)
+
+    def timed_calc(self, pair):
+        """
+        Run a single calc and report back its outcome and latency, so the
+        parent process can aggregate progress across workers.
+        """
+        firm_provided_key, entity_id = pair
+        start = time.perf_counter()
+        ok = True
+        restated = None
         try:
-            resp = self.get_calculation("net-asset-value-history", payload)
-            parser = ChartTableFormatter(resp, payload)
-            res = parser.parse_data()
-            logger.info(f"Download OK for {self.args.level[:(-1)]} {firm_provided_key}")
-            res.insert(
-                1, f"{self.args.level.capitalize()[:(-1)]} ID", firm_provided_key
-            )
-            res.to_csv(os.path.join(self.output_folder, filename), index=False)
+            restated = self.run_calc(firm_provided_key, entity_id)
         except NoResponseError:
+            ok = False
             logger.warning(
                 f"No response for {self.args.level[:(-1)]} {firm_provided_key}"
             )
+        except Exception as e:
+            ok = False
+            logger.error(
+                f"Download failed for {self.args.level[:(-1)]} {firm_provided_key}: {e}"
+            )
+        return ok, time.perf_counter() - start, restated
 
     def run_parallel_calcs(self):
-        downloaded_accounts = [
-            acc.replace(".csv", "") for acc in os.listdir(self.output_folder)
-        ]
-        entity_ids = self.entity_ids[
-            ~self.entity_ids["firm_provided_key"].isin(downloaded_accounts)
-        ]
+        entity_ids = self.entity_ids
+        if not self.args.incremental:
+            downloaded_accounts = [
+                acc.replace(".csv", "") for acc in os.listdir(self.output_folder)
+            ]
+            entity_ids = entity_ids[
+                ~entity_ids["firm_provided_key"].isin(downloaded_accounts)
+            ]
         account_entity_id_pairs = tuple(
             zip(
                 entity_ids["firm_provided_key"].tolist(),
                 entity_ids["entity_id"].tolist(),
             )
         )
-        with Pool() as pool:
-            pool.starmap(self.run_calc, account_entity_id_pairs)
+        progress = ProgressTracker(
+            len(account_entity_id_pairs), logger, self.args.progress_interval
+        )
+        restated = []
+        with Pool(self.args.workers) as pool:
+            results = pool.imap_unordered(self.timed_calc, account_entity_id_pairs)
+            while True:
+                try:
+                    ok, latency, restated_rows = results.next(
+                        timeout=progress.next_report_in()
+                    )
+                except TimeoutError:
+                    # no completion within the interval, report the stall
+                    progress.poll()
+                    continue
+                except StopIteration:
+                    break
+                progress.update(latency, ok)
+                if restated_rows is not None:
+                    restated.append(restated_rows)
+        progress.report()
+        progress.save_summary(self.summary_file)
+        logger.info(f"Download summary saved to {self.summary_file}")
+
+        if restated:
+            pd.concat(restated, ignore_index=True).to_csv(
+                self.restated_file, index=False
+            )
+            logger.warning(f"Restatements saved to {self.restated_file}")
 
     def concatenate_data(self):
-        files = os.listdir(self.output_folder)
+        files = [
+            file
+            for file in os.listdir(self.output_folder)
+            if "concatenated" not in file
+        ]
         if not files:
             logger.warning("No files to concatenate")
             return
@@ -231,12 +528,21 @@ class OADataDownload(BaseMain):
 
         if dataframes:
             concatenated_df = pd.concat(dataframes, ignore_index=True).sort_values(
-                by=[f"{self.args.level.capitalize()[:(-1)]} ID", "Date"]
+                by=[self.entity_id_col, "Date"]
             )
             concatenated_df.to_csv(
                 os.path.join(self.output_folder, f"concatenated_{self.args.level}.csv"),
                 index=False,
             )
+            try:
+                concatenated_df.to_parquet(
+                    os.path.join(
+                        self.output_folder, f"concatenated_{self.args.level}.parquet"
+                    ),
+                    index=False,
+                )
+            except ImportError:
+                logger.info("pyarrow not installed, skipping the parquet copy")
             logger.info("Data concatenation completed")
         else:
             logger.warning("No valid dataframes to concatenate")
@@ -1,11 +1,26 @@
 from utils import logger_setup
+from tolerance import ToleranceEngine
+from break_stats import BreakCube
+from content_hash import identical_files
+from top_breaks import TopBreaks
+from recon_store import ReconStore, add_store_args
+from frame_engine import get_engine, add_engine_args
 import pandas as pd
 import os
 import argparse
 from datetime import datetime
+from multiprocess import Pool, Lock
 
 logger = logger_setup("logs", "vnf_recon")
 
+# Lock shared by the recon workers to append to the output files
+write_lock = None
+
+
+def init_writer(lock):
+    global write_lock
+    write_lock = lock
+
 
 class OARecon:
     def __init__(self):
@@ -34,6 +49,56 @@ class OARecon:
             default="accounts",
             help="Set the recon level (either accounts, clients or households)",
         )
+        self.parser.add_argument(
+            "-bk",
+            "--bulk",
+            dest="bulk",
+            action="store_true",
+            default=False,
+            help="Load both environments at once and reconcile them in a single join",
+        )
+        self.parser.add_argument(
+            "-w",
+            "--workers",
+            dest="workers",
+            type=int,
+            default=None,
+            help="Reconcile entities on this many processes, streaming results to disk",
+        )
+        self.parser.add_argument(
+            "-si",
+            "--skip_identical",
+            dest="skip_identical",
+            action="store_true",
+            default=False,
+            help="Skip entity files with the same content in both environments",
+        )
+        self.parser.add_argument(
+            "-tk",
+            "--top_k",
+            dest="top_k",
+            type=int,
+            default=None,
+            help="Write a report of the K largest breaks per metric",
+        )
+        self.parser.add_argument(
+            "-tko",
+            "--top_k_only",
+            dest="top_k_only",
+            action="store_true",
+            default=False,
+            help="Write the top K report instead of the full recon file",
+        )
+        add_store_args(self.parser)
+        add_engine_args(self.parser)
+        self.parser.add_argument(
+            "-tol",
+            "--tolerance",
+            dest="tolerance",
+            type=str,
+            default="1",
+            help="Tolerances, e.g. '1' or '1,Total Return=0.0001'",
+        )
         self.args = self.parser.parse_args()
         # self.base_columns = ["Entity ID", "Date"]
         self.comparison_columns = [
@@ -45,6 +110,13 @@ class OARecon:
             "Market Value EoP",
             "Total Return",
         ]
+        self.tolerance = ToleranceEngine.from_string(
+            self.args.tolerance, decimals=4, inclusive=True
+        )
+        if self.args.top_k_only and not self.args.top_k:
+            self.parser.error("--top_k_only requires --top_k")
+        self.top_breaks = self.new_top_breaks()
+        self.engine = get_engine(self.args.engine)
 
     @property
     def base_columns(self):
@@ -66,16 +138,124 @@ class OARecon:
         target_files = [file for file in target_files if "concatenated" not in file]
         return target_files
 
-    def get_vnf_data(self, file_path):
-        vnf_data = pd.read_csv(file_path)
-        vnf_data = vnf_data[self.base_columns + self.comparison_columns]
-        vnf_data = vnf_data.rename(
+    @property
+    def recon_columns(self):
+        return [
+            f"{index + 1} - {value}_recon"
+            for index, value in enumerate(self.comparison_columns)
+        ]
+
+    @property
+    def full_recon_columns(self):
+        cols = [
+            f"{index + 1} - {value}_{suffix}"
+            for index, value in enumerate(self.comparison_columns)
+            for suffix in [self.args.base_env, self.args.target_env, "recon"]
+        ]
+        cols.sort()
+        return self.base_columns + cols
+
+    def output_path(self, kind, today):
+        return f"OA_recon/outputs/{kind}_{self.args.level}_{today}.csv"
+
+    def rename_comparison_columns(self, df):
+        return df.rename(
             columns={
                 value: f"{index+1} - {value}"
                 for index, value in enumerate(self.comparison_columns)
             }
         )
-        return vnf_data
+
+    def find_identical(self, files):
+        """
+        Content hash pre-pass: entity files identical in both environments are
+        counted as reconciled without merging or filtering them, see
+        identical_recon.
+        """
+        if not self.args.skip_identical:
+            return {}
+        identical = identical_files(
+            f"OA_recon/outputs/{self.args.base_env}/{self.args.level}",
+            f"OA_recon/outputs/{self.args.target_env}/{self.args.level}",
+            files,
+        )
+        logger.info(
+            f"{len(identical)}/{len(files)} entities identical in both environments "
+            f"({sum(identical.values())} rows), counted as reconciled"
+        )
+        return identical
+
+    def identical_recon(self, file):
+        """
+        Recon rows of an entity identical in both environments, built from the
+        base file alone: both sides get its values and every diff is zero.
+        """
+        base_df = self.get_vnf_data(
+            f"OA_recon/outputs/{self.args.base_env}/{self.args.level}/{file}"
+        ).fillna(0)
+        for col in base_df.columns[len(self.base_columns) :]:
+            base_df[f"{col}_{self.args.target_env}"] = base_df[col]
+            base_df.rename(columns={col: f"{col}_{self.args.base_env}"}, inplace=True)
+        base_df[self.recon_columns] = 0.0
+        cols = base_df.columns.tolist()[2:]
+        cols.sort()
+        recon_df = base_df[self.base_columns + cols]
+        recon_df = recon_df[recon_df["Date"] != "2020-12-31"]
+        recon_df = recon_df.sort_values(self.base_columns, ignore_index=True)
+        return recon_df.rename(columns={"Entity ID": "Account ID"})
+
+    def get_vnf_data(self, file_path):
+        vnf_data = pd.read_csv(file_path)
+        vnf_data = vnf_data[self.base_columns + self.comparison_columns]
+        return self.rename_comparison_columns(vnf_data)
+
+    def load_environment(self, env):
+        """
+        Load every entity of an environment at once. Uses the columnar
+        concatenated file when available, then the concatenated csv, and only
+        falls back to reading the entity files one by one.
+        """
+        folder = f"OA_recon/outputs/{env}/{self.args.level}"
+        columns = self.base_columns + self.comparison_columns
+        parquet_file = os.path.join(folder, f"concatenated_{self.args.level}.parquet")
+        csv_file = os.path.join(folder, f"concatenated_{self.args.level}.csv")
+        if os.path.exists(parquet_file):
+            env_data = pd.read_parquet(parquet_file, columns=columns)
+        elif os.path.exists(csv_file):
+            env_data = pd.read_csv(csv_file, usecols=columns)
+        else:
+            files = [file for file in os.listdir(folder) if "concatenated" not in file]
+            env_data = pd.concat(
+                [
+                    pd.read_csv(os.path.join(folder, file), usecols=columns)
+                    for file in files
+                ],
+                ignore_index=True,
+            )
+        env_data["Date"] = env_data["Date"].astype(str)
+        return self.rename_comparison_columns(env_data)
+
+    def merge_environments(self):
+        """
+        Outer join of both environments on entity ID and date, restricted to
+        the entities present on both sides as in the file by file recon.
+        """
+        base_df = self.load_environment(self.args.base_env)
+        target_df = self.load_environment(self.args.target_env)
+        entity_id_col = self.base_columns[0]
+        common = set(base_df[entity_id_col]) & set(target_df[entity_id_col])
+        skipped = base_df.loc[~base_df[entity_id_col].isin(common), entity_id_col]
+        if not skipped.empty:
+            logger.info(f"No target data for {skipped.nunique()} entities. Skipped")
+        recon_df = self.engine.merge(
+            base_df[base_df[entity_id_col].isin(common)],
+            target_df[target_df[entity_id_col].isin(common)],
+            how="outer",
+            on=self.base_columns,
+            suffixes=[f"_{self.args.base_env}", f"_{self.args.target_env}"],
+        )
+        recon_df = recon_df.fillna(0)
+        return recon_df
 
     def merge_data(self, file):
         base_df = self.get_vnf_data(
@@ -85,7 +265,8 @@ class OARecon:
             f"OA_recon/outputs/{self.args.target_env}/{self.args.level}/{file}"
         )
 
-        recon_df = base_df.merge(
+        recon_df = self.engine.merge(
+            base_df,
             target_df,
             how="outer",
             on=self.base_columns,
@@ -94,19 +275,19 @@ class OARecon:
         recon_df = recon_df.fillna(0)
         return recon_df
 
-    def run_recon(self, df):
+    def check_tolerances(self, df):
         cols = [
             f"{index+1} - {value}"
             for index, value in enumerate(self.comparison_columns)
         ]
-        for col in cols:
-            df[f"{col}_recon"] = round(
-                abs(
-                    df[f"{col}_{self.args.base_env}"]
-                    - df[f"{col}_{self.args.target_env}"]
-                ),
-                4,
-            )
+        return self.tolerance.compare(
+            self.comparison_columns,
+            df[[f"{col}_{self.args.base_env}" for col in cols]],
+            df[[f"{col}_{self.args.target_env}" for col in cols]],
+        )
+
+    def run_recon(self, df):
+        df[self.recon_columns] = self.check_tolerances(df).abs_diff
         cols = df.columns.tolist()[2:]
         cols.sort()
         final_df = df[self.base_columns + cols]
@@ -114,87 +295,300 @@ class OARecon:
         return final_df
 
     def filter_non_recon_entries(self, df):
-        recon_cols = [
-            f"{index+1} - {value}_recon"
-            for index, value in enumerate(self.comparison_columns)
-        ]
-        non_recon_df = df[df.loc[:, recon_cols].gt(1).any(axis=1)]
+        non_recon_df = df[self.check_tolerances(df).breaks()]
         return non_recon_df
 
-    def count_breaks(self, df):
-        recon_cols = [
-            f"{index + 1} - {value}_recon"
+    def new_top_breaks(self):
+        if not self.args.top_k:
+            return None
+        return TopBreaks(
+            self.comparison_columns,
+            self.args.top_k,
+            entity_column=self.base_columns[0],
+            labels=[self.args.base_env, self.args.target_env],
+        )
+
+    def update_top_breaks(self, top_breaks, df):
+        if top_breaks is None:
+            return
+        cols = [
+            f"{index+1} - {value}"
             for index, value in enumerate(self.comparison_columns)
         ]
-        entity_id_col = self.base_columns[0]
-        breaks = (
-            df.groupby(entity_id_col)[recon_cols]
-            .apply(lambda x: (abs(x) > 1).sum())
-            .reset_index(drop=False)
+        top_breaks.update(
+            df[self.base_columns],
+            self.check_tolerances(df),
+            df[[f"{col}_{self.args.base_env}" for col in cols]],
+            df[[f"{col}_{self.args.target_env}" for col in cols]],
         )
-        return breaks
 
-    def recon_values_and_flows(self):
-        today = datetime.today().strftime("%Y-%m-%d")
-        # base_files = os.listdir(f"OA_recon/outputs/{self.args.base_env}/{self.args.level}")
-        # target_files = os.listdir(f"OA_recon/outputs/{self.args.target_env}/{self.args.level}")
-        accounts = pd.read_csv("OA_recon/inputs/Account.csv")[
-            ["AccountCode", "AccountName", "CustodianName"]
-        ]
-        accounts.rename(
+    def break_counts_from_cube(self, cube, break_cube):
+        entity_id_col = self.base_columns[0]
+        breaks = break_cube.slice(cube, entity_id_col).rename(
             columns={
-                "AccountCode": "Account ID",
-                "AccountName": "Account Name",
-                "CustodianName": "Custodian",
-            },
-            inplace=True,
+                f"{value} Breaks": recon_col
+                for value, recon_col in zip(self.comparison_columns, self.recon_columns)
+            }
         )
-        total_files = len(self.base_files)
+        return breaks[[entity_id_col] + self.recon_columns]
+
+    def break_statistics(self, df):
+        """
+        Break counts and sums per entity and date, rolled up to entity and
+        grand total, in one pass over the recon rows.
+        """
+        break_cube = BreakCube(self.base_columns, self.comparison_columns)
+        result = self.check_tolerances(df)
+        cube = break_cube.build(df, ~result.reconciled, result.abs_diff)
+        return cube, self.break_counts_from_cube(cube, break_cube)
+
+    def recon_file_by_file(self):
+        base_files = self.base_files
+        target_files = set(self.target_files)
+        identical = self.find_identical(base_files)
+        total_files = len(base_files)
         counter = 0
         full_recon_list = []
         filtered_recon_list = []
-        break_count_list = []
-        for file in self.base_files:
+        for file in base_files:
             counter += 1
             logger.info(f"Reconciling file #{counter}/{total_files}")
-            if file not in self.target_files:
+            if file not in target_files:
                 logger.info("No target data. Skip file")
                 continue
+            if file in identical:
+                logger.info("Identical in both environments. Counted as reconciled")
+                full_recon_list.append(self.identical_recon(file))
+                continue
             try:
                 merged_df = self.merge_data(file)
                 recon_df = self.run_recon(merged_df)
                 recon_df.rename(columns={"Entity ID": "Account ID"}, inplace=True)
                 full_recon_list.append(recon_df)
                 filtered_recon_list.append(self.filter_non_recon_entries(recon_df))
-                break_count_list.append(self.count_breaks(recon_df))
+                self.update_top_breaks(self.top_breaks, recon_df)
                 logger.info(f"MERGED FILE {file}")
             except:
                 logger.warning(f"SKIPPED FILE {file}")
                 continue
+        return full_recon_list, filtered_recon_list
 
+    def recon_bulk(self):
+        logger.info("Reconciling both environments in bulk")
+        merged_df = self.merge_environments()
+        if merged_df.empty:
+            return [], []
+        recon_df = self.run_recon(merged_df)
+        recon_df.rename(columns={"Entity ID": "Account ID"}, inplace=True)
+        self.update_top_breaks(self.top_breaks, recon_df)
+        return [recon_df], [self.filter_non_recon_entries(recon_df)]
+
+    def recon_entity(self, file, today, identical=False):
+        """
+        Reconcile one entity and append its rows to the shared output files,
+        including its date and entity levels of the break cube. Only the
+        outcome, the entity's largest breaks and its contribution to the cube
+        total go back to the parent, so its memory stays flat.
+        """
         try:
-            pd.concat(full_recon_list).sort_values(self.base_columns).to_csv(
-                f"OA_recon/outputs/full_recon_{self.args.level}_{today}.csv",
+            if identical:
+                recon_df = self.identical_recon(file)
+                filtered_df = recon_df.iloc[:0]
+                top_breaks = None
+            else:
+                merged_df = self.merge_data(file)
+                recon_df = self.run_recon(merged_df)
+                recon_df.rename(columns={"Entity ID": "Account ID"}, inplace=True)
+                filtered_df = self.filter_non_recon_entries(recon_df)
+                top_breaks = self.new_top_breaks()
+                self.update_top_breaks(top_breaks, recon_df)
+            cube, breaks_df = self.break_statistics(recon_df)
+        except Exception:
+            return file, False, None, None
+        is_total = cube["Level"] == "Total"
+        with write_lock:
+            for kind, df in self.streamed_outputs(
+                recon_df, filtered_df, breaks_df, cube[~is_total]
+            ):
+                df.to_csv(
+                    self.output_path(kind, today), mode="a", header=False, index=False
+                )
+        return file, True, top_breaks, cube[is_total]
+
+    def streamed_outputs(self, full_recon, filtered_recon, break_count, break_cube):
+        outputs = [
+            ("full_recon", full_recon),
+            ("filtered_recon", filtered_recon),
+            ("break_count", break_count),
+            ("break_cube", break_cube),
+        ]
+        if self.args.top_k_only:
+            outputs = outputs[1:]
+        return outputs
+
+    def recon_parallel(self, today):
+        """
+        Spread the per-entity recon over a process pool. Output rows are
+        grouped by entity and sorted by date within it, but entities are
+        written in completion order. The break cube total is summed here from
+        the totals of the entities and appended last.
+        """
+        break_cube = BreakCube(self.base_columns, self.comparison_columns)
+        cube_columns = (
+            ["Level"] + self.base_columns + break_cube.value_columns(with_sums=True)
+        )
+        for kind, columns in self.streamed_outputs(
+            self.full_recon_columns,
+            self.full_recon_columns,
+            self.base_columns[:1] + self.recon_columns,
+            cube_columns,
+        ):
+            pd.DataFrame(columns=columns).to_csv(
+                self.output_path(kind, today), index=False
+            )
+
+        target_files = set(self.target_files)
+        files = [file for file in self.base_files if file in target_files]
+        logger.info(f"No target data for {len(self.base_files) - len(files)} files")
+        identical = self.find_identical(files)
+        total_files = len(files)
+        counter = 0
+        totals = []
+        with Pool(
+            self.args.workers, initializer=init_writer, initargs=(Lock(),)
+        ) as pool:
+            for file, ok, top_breaks, total in pool.imap_unordered(
+                lambda file: self.recon_entity(file, today, file in identical), files
+            ):
+                counter += 1
+                if top_breaks is not None:
+                    self.top_breaks.merge(top_breaks)
+                if total is not None:
+                    totals.append(total)
+                if ok:
+                    logger.info(f"MERGED FILE {file} (#{counter}/{total_files})")
+                else:
+                    logger.warning(f"SKIPPED FILE {file} (#{counter}/{total_files})")
+
+        if totals:
+            total = pd.concat(totals, ignore_index=True)
+            value_cols = cube_columns[1 + len(self.base_columns) :]
+            total = total.iloc[:1].assign(**total[value_cols].sum())
+            total[cube_columns].to_csv(
+                self.output_path("break_cube", today),
+                mode="a",
+                header=False,
                 index=False,
             )
+
+    def save_top_breaks(self, today):
+        if self.top_breaks is None:
+            return
+        self.top_breaks.report().to_csv(
+            self.output_path("top_breaks", today), index=False
+        )
+
+    def store_results(self, today, full_recon=None, full_recon_file=None):
+        """
+        Ingest the full recon in the results store, from memory or, after a
+        parallel run, from the full recon file it streamed.
+        """
+        if not self.args.results_db:
+            return
+        if full_recon is not None:
+            chunks = [full_recon]
+        elif full_recon_file is not None:
+            chunks = pd.read_csv(full_recon_file, chunksize=100000)
+        else:
+            logger.warning("No full recon to store")
+            return
+        cols = [
+            f"{index+1} - {value}"
+            for index, value in enumerate(self.comparison_columns)
+        ]
+        store = ReconStore(self.args.results_db)
+        run_id = store.start_run(
+            "oa_recon",
+            self.args.level,
+            self.args.base_env,
+            self.args.target_env,
+            today,
+        )
+        for chunk in chunks:
+            result = self.check_tolerances(chunk)
+            store.ingest(
+                run_id,
+                pd.DataFrame(
+                    {"date": chunk["Date"], "entity_id": chunk[self.base_columns[0]]}
+                ),
+                self.comparison_columns,
+                chunk[[f"{col}_{self.args.base_env}" for col in cols]],
+                chunk[[f"{col}_{self.args.target_env}" for col in cols]],
+                result.diff,
+                result.reconciled,
+            )
+        store.close()
+        logger.info(f"Results saved to {self.args.results_db} (run {run_id})")
+
+    def recon_values_and_flows(self):
+        today = datetime.today().strftime("%Y-%m-%d")
+        accounts = pd.read_csv("OA_recon/inputs/Account.csv")[
+            ["AccountCode", "AccountName", "CustodianName"]
+        ]
+        accounts.rename(
+            columns={
+                "AccountCode": "Account ID",
+                "AccountName": "Account Name",
+                "CustodianName": "Custodian",
+            },
+            inplace=True,
+        )
+        if self.args.workers:
+            self.recon_parallel(today)
+            self.save_top_breaks(today)
+            # with --top_k_only this run streamed no full recon, an older file
+            # of the same day must not be stored in its place
+            self.store_results(
+                today,
+                full_recon_file=(
+                    None
+                    if self.args.top_k_only
+                    else self.output_path("full_recon", today)
+                ),
+            )
+            return
+        if self.args.bulk:
+            full_recon_list, filtered_recon_list = self.recon_bulk()
+        else:
+            full_recon_list, filtered_recon_list = self.recon_file_by_file()
+
+        try:
+            full_recon = pd.concat(full_recon_list).sort_values(self.base_columns)
+            if not self.args.top_k_only:
+                full_recon.to_csv(self.output_path("full_recon", today), index=False)
         except ValueError:
+            full_recon = None
             print("Nothing to concatenate on full recon")
 
         try:
             pd.concat(filtered_recon_list).sort_values(self.base_columns).to_csv(
-                f"OA_recon/outputs/filtered_recon_{self.args.level}_{today}.csv",
+                self.output_path("filtered_recon", today),
                 index=False,
             )
         except ValueError:
             print("Nothing to concatenate on filtered recon")
 
-        try:
-            pd.concat(break_count_list).sort_values(self.base_columns[0]).to_csv(
-                f"OA_recon/outputs/break_count_{self.args.level}_{today}.csv",
+        if full_recon is not None:
+            self.store_results(today, full_recon)
+            cube, break_count = self.break_statistics(full_recon)
+            cube.to_csv(self.output_path("break_cube", today), index=False)
+            break_count.sort_values(self.base_columns[0]).to_csv(
+                self.output_path("break_count", today),
                 index=False,
             )
-        except ValueError:
+        else:
             print("Nothing to concatenate on break count")
+        self.save_top_breaks(today)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+"""
+Break statistics cube shared by the recon scripts.
+
+Counts (and optionally sums of the absolute diffs) of breaks for every metric
+are aggregated in a single groupby at the finest grain, e.g. account x
+security type. Coarser levels are rolled up from that aggregate rather than
+from the rows, and all levels are stacked in one frame with a 'Level'
+column, where rolled up dimensions hold 'All'. Reports slice the cube instead
+of re-grouping the recon rows.
+"""
+
+
+class BreakCube:
+    TOTAL = "All"
+
+    def __init__(self, dimensions, metrics, rollup=True, any_breaks=True):
+        """
+        :param dimensions: grouping columns, from the coarsest to the finest
+        :param metrics: metric names, in the column order of the break arrays
+        :param rollup: add one level per dimension prefix plus a grand total
+        :param any_breaks: add a count of rows breaking on any metric
+        """
+        self.dimensions = list(dimensions)
+        self.metrics = list(metrics)
+        self.rollup = rollup
+        self.any_breaks = any_breaks
+
+    def value_columns(self, with_sums=False):
+        cols = ["Rows"] + [f"{metric} Breaks" for metric in self.metrics]
+        if self.any_breaks:
+            cols.append("Any Breaks")
+        if with_sums:
+            cols += [f"{metric} Break Sum" for metric in self.metrics]
+        return cols
+
+    def build(self, df, broken, diffs=None) -> pd.DataFrame:
+        """
+        :param df: recon rows holding the dimension columns
+        :param broken: (rows x metrics) boolean array of breaks
+        :param diffs: optional (rows x metrics) array of absolute diffs
+        """
+        broken = np.asarray(broken, dtype=bool)
+        data = df[self.dimensions].copy()
+        data["Rows"] = 1
+        for index, metric in enumerate(self.metrics):
+            data[f"{metric} Breaks"] = broken[:, index].astype(np.int64)
+        if self.any_breaks:
+            data["Any Breaks"] = broken.any(axis=1).astype(np.int64)
+        if diffs is not None:
+            diffs = np.where(broken, np.asarray(diffs, dtype=float), 0.0)
+            for index, metric in enumerate(self.metrics):
+                data[f"{metric} Break Sum"] = diffs[:, index]
+        value_cols = self.value_columns(with_sums=diffs is not None)
+
+        finest = (
+            data.groupby(self.dimensions, dropna=False)[value_cols].sum().reset_index()
+        )
+        finest["Level"] = self.dimensions[-1]
+        levels = [finest]
+        if self.rollup:
+            for depth in range(len(self.dimensions) - 1, -1, -1):
+                keep = self.dimensions[:depth]
+                if keep:
+                    level = (
+                        finest.groupby(keep, dropna=False)[value_cols]
+                        .sum()
+                        .reset_index()
+                    )
+                else:
+                    level = (
+                        finest.groupby(np.zeros(len(finest)))[value_cols]
+                        .sum()
+                        .reset_index(drop=True)
+                    )
+                for dim in self.dimensions[depth:]:
+                    level[dim] = self.TOTAL
+                level["Level"] = keep[-1] if keep else "Total"
+                levels.append(level)
+
+        cube = pd.concat(levels, ignore_index=True)
+        return cube[["Level"] + self.dimensions + value_cols]
+
+    def slice(self, cube, level) -> pd.DataFrame:
+        """Rows of one level, without the 'Level' and rolled up columns."""
+        if level == "Total":
+            dims = []
+        else:
+            dims = self.dimensions[: self.dimensions.index(level) + 1]
+        value_cols = [
+            col for col in cube.columns if col not in ["Level"] + self.dimensions
+        ]
+        return cube.loc[cube["Level"] == level, dims + value_cols].reset_index(
+            drop=True
+        )
@@ -0,0 +1,62 @@
+import hashlib
+import os
+import pandas as pd
+
+"""
+Content hashes of entity files, used by the regression recons to skip the
+entities whose history did not change between two environments.
+
+The hash is taken over the data rows after normalizing line endings and
+trailing whitespace and sorting the rows, so files written in a different row
+order or on a different platform still match. Files are only read as bytes,
+never parsed, which makes the pre-pass much cheaper than the merge and diff it
+short-circuits. Any other difference, including number formatting, sends the
+entity through the full comparison.
+
+The same idea applies to dataframes already in memory: frame_digests hashes
+the rows of each account (or any group) so that the unchanged ones can be
+skipped between two runs.
+"""
+
+
+def file_digest(file_path):
+    """
+    :return: (hex digest, number of data rows) of a csv file
+    """
+    with open(file_path, "rb") as f:
+        lines = [line.rstrip() for line in f.read().splitlines()]
+    lines = [line for line in lines if line]
+    header, rows = (lines[0], sorted(lines[1:])) if lines else (b"", [])
+    digest = hashlib.blake2b(header, digest_size=16)
+    for row in rows:
+        digest.update(b"\n")
+        digest.update(row)
+    return digest.hexdigest(), len(rows)
+
+
+def identical_files(base_folder, target_folder, files):
+    """
+    Files with the same normalized content in both folders.
+    :return: dict of file name -> number of data rows
+    """
+    identical = {}
+    for file in files:
+        base_path = os.path.join(base_folder, file)
+        target_path = os.path.join(target_folder, file)
+        if not (os.path.exists(base_path) and os.path.exists(target_path)):
+            continue
+        base_digest, rows = file_digest(base_path)
+        if base_digest == file_digest(target_path)[0]:
+            identical[file] = rows
+    return identical
+
+
+def frame_digests(df, by):
+    """
+    Order independent digest of the rows of each group of a dataframe, the
+    wrapping sum of the row hashes.
+    :return: dict of group -> hex digest
+    """
+    rows = pd.util.hash_pandas_object(df, index=False)
+    digests = rows.groupby(df[by].astype(str).to_numpy()).sum()
+    return {group: f"{digest:016x}" for group, digest in digests.items()}
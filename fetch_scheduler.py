@@ -0,0 +1,94 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+LOG = logging.getLogger(__name__)
+
+"""
+Concurrent loading of the independent inputs of a script.
+
+Each input is a fetch step (the S3 transfer, I/O bound) followed by a parse
+step (the CSV parse and clean up, CPU bound). Fetches run in threads; parses
+run in the same thread, or in a process pool when parse_processes is set, so
+the inputs load in the time of the slowest one instead of the sum of all:
+
+    scheduler = FetchScheduler(io_workers=4)
+    scheduler.add("position", lambda: s3_cache.fetch(path), lambda local: read(local))
+    inputs = scheduler.run()
+
+The timings of every stage are logged and kept in scheduler.timings.
+"""
+
+
+def timed(step, *args):
+    start = time.perf_counter()
+    result = step(*args)
+    return result, time.perf_counter() - start
+
+
+class FetchScheduler:
+    def __init__(self, io_workers=4, parse_processes=0):
+        self.io_workers = io_workers
+        self.parse_processes = parse_processes
+        self.tasks = {}
+        self.timings = {}
+
+    def add(self, name, fetch, parse):
+        """
+        :param fetch: callable without arguments, e.g. a download
+        :param parse: callable taking the result of fetch, returning the input
+        """
+        self.tasks[name] = (fetch, parse)
+
+    def load(self, name, pool):
+        fetch, parse = self.tasks[name]
+        fetched, fetch_time = timed(fetch)
+        if pool is None:
+            result, parse_time = timed(parse, fetched)
+        else:
+            result, parse_time = pool.apply(timed, (parse, fetched))
+        self.timings[name] = {
+            "fetch": fetch_time,
+            "parse": parse_time,
+            "total": fetch_time + parse_time,
+        }
+        return result
+
+    def run(self):
+        """
+        Load every input.
+        :return: {name: parsed input}, in the order the inputs were added
+        """
+        pool = None
+        if self.parse_processes:
+            from multiprocess import Pool
+
+            pool = Pool(self.parse_processes)
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=self.io_workers) as executor:
+                futures = {
+                    name: executor.submit(self.load, name, pool) for name in self.tasks
+                }
+                results = {name: future.result() for name, future in futures.items()}
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        self.report(time.perf_counter() - start)
+        return results
+
+    def report(self, elapsed):
+        for name in self.tasks:
+            timing = self.timings[name]
+            LOG.info(
+                f"Loaded {name} in {timing['total']:.2f}s "
+                f"(fetch {timing['fetch']:.2f}s, parse {timing['parse']:.2f}s)"
+            )
+        if self.timings:
+            slowest = max(self.timings, key=lambda name: self.timings[name]["total"])
+            LOG.info(
+                f"Inputs loaded in {elapsed:.2f}s, critical path {slowest} "
+                f"({self.timings[slowest]['total']:.2f}s), sequential "
+                f"{sum(timing['total'] for timing in self.timings.values()):.2f}s"
+            )
@@ -0,0 +1,290 @@
+import argparse
+import time
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+
+from utils import InputValidationError
+
+"""
+Pluggable engine for the joins at the core of the recon and valuation scripts.
+
+MyDailyRecon, OARecon and TransferValues do their merges through an engine
+chosen with -eng/--engine:
+
+    pandas   the reference implementation, pd.merge
+    polars   multi-threaded hash join in Polars (optional dependency)
+    pyarrow  multi-threaded hash join in PyArrow/Acero (optional dependency)
+
+Every engine takes and returns pandas dataframes with the semantics of
+pd.merge: keys default to the common columns, overlapping columns get the
+suffixes, left joins keep the order of the left rows and outer joins come out
+sorted by key. The rest of the scripts is unchanged, so an engine only pays
+off when the joins dominate, i.e. on production-size inputs.
+
+encoded_outer_join runs an outer join on integer codes of composite keys
+through an engine, as MyDailyRecon joins the tracking and position files.
+Running this module checks every installed engine against pandas on
+synthetic recon inputs, with the joins of MyDailyRecon and OARecon, and
+times them:
+
+    python frame_engine.py -r 1000000 -e polars pyarrow
+"""
+
+
+class PandasEngine:
+    name = "pandas"
+
+    def merge(self, left, right, how="inner", on=None, suffixes=("_x", "_y")):
+        return left.merge(right, how=how, on=on, suffixes=suffixes)
+
+
+class ColumnarEngine(PandasEngine, ABC):
+    """Shared pd.merge semantics on top of a columnar join."""
+
+    ROW = "__row__"
+
+    @abstractmethod
+    def join(self, left, right, how, on):
+        """
+        Join of the engine, keys coalesced, rows in any order
+        :param how: inner, left or outer
+        """
+
+    def merge(self, left, right, how="inner", on=None, suffixes=("_x", "_y")):
+        on = list(on) if on is not None else [c for c in left if c in right]
+        if not on:
+            raise InputValidationError("No common columns to merge on")
+        overlap = [c for c in left if c in right and c not in on]
+        left = left.rename(columns={c: f"{c}{suffixes[0]}" for c in overlap})
+        right = right.rename(columns={c: f"{c}{suffixes[1]}" for c in overlap})
+        if how == "left":
+            left = left.assign(**{self.ROW: np.arange(len(left))})
+
+        merged = self.join(left, right, how, on)
+
+        if how == "left":
+            merged = merged.sort_values(self.ROW, kind="stable").drop(columns=self.ROW)
+        elif how == "outer":
+            merged = merged.sort_values(on, kind="stable", na_position="last")
+        columns = list(left.columns) + [c for c in right if c not in on]
+        return merged[[c for c in columns if c != self.ROW]].reset_index(drop=True)
+
+
+class PolarsEngine(ColumnarEngine):
+    name = "polars"
+
+    def __init__(self):
+        import polars
+
+        self.pl = polars
+
+    def join(self, left, right, how, on):
+        merged = self.pl.from_pandas(left).join(
+            self.pl.from_pandas(right),
+            on=on,
+            how={"outer": "full"}.get(how, how),
+            coalesce=True,
+            nulls_equal=True,
+        )
+        return merged.to_pandas()
+
+
+class PyArrowEngine(ColumnarEngine):
+    name = "pyarrow"
+
+    def __init__(self):
+        import pyarrow
+
+        self.pa = pyarrow
+
+    def join(self, left, right, how, on):
+        join_type = {"inner": "inner", "left": "left outer", "outer": "full outer"}
+        merged = self.pa.Table.from_pandas(left, preserve_index=False).join(
+            self.pa.Table.from_pandas(right, preserve_index=False),
+            keys=on,
+            join_type=join_type[how],
+            coalesce_keys=True,
+            use_threads=True,
+        )
+        return merged.to_pandas()
+
+
+ENGINES = {
+    engine.name: engine for engine in [PandasEngine, PolarsEngine, PyArrowEngine]
+}
+
+
+def get_engine(name="pandas"):
+    if name not in ENGINES:
+        raise InputValidationError(
+            f"Unknown engine {name}, use one of {', '.join(ENGINES)}"
+        )
+    try:
+        return ENGINES[name]()
+    except ImportError:
+        raise InputValidationError(f"The {name} engine requires {name} to be installed")
+
+
+def add_engine_args(parser):
+    parser.add_argument(
+        "-eng",
+        "--engine",
+        dest="engine",
+        type=str,
+        default="pandas",
+        choices=list(ENGINES),
+        help="DataFrame engine for the joins (pandas, polars or pyarrow)",
+    )
+
+
+KEY_CODE = "__key__"
+
+
+def encode_keys(keys, *frames):
+    """
+    Index every frame by one integer code per combination of the key columns,
+    shared by all of them
+    :return: (encoded frames, key columns indexed by code)
+    """
+    values = pd.concat([frame[keys] for frame in frames], ignore_index=True)
+    codes = values.groupby(keys, dropna=False, sort=False).ngroup().to_numpy()
+    lookup = values.set_index(codes)
+    lookup = lookup[~lookup.index.duplicated()]
+    encoded, start = [], 0
+    for frame in frames:
+        encoded.append(frame.set_axis(codes[start : start + len(frame)]))
+        start += len(frame)
+    return encoded, lookup
+
+
+def encoded_outer_join(engine, left, right, keys):
+    """
+    Outer join of two frames on integer codes of their key columns, which
+    hash and compare faster than the composite string keys. Rows come out
+    sorted by code, and the key columns are restored from the codes.
+    """
+    (left, right), lookup = encode_keys(keys, left, right)
+    merged = engine.merge(
+        left.drop(columns=keys).rename_axis(KEY_CODE).reset_index(),
+        right.drop(columns=keys).rename_axis(KEY_CODE).reset_index(),
+        how="outer",
+        on=[KEY_CODE],
+    )
+    merged[keys] = lookup.loc[merged[KEY_CODE], keys].to_numpy()
+    columns = list(left.columns) + [col for col in right if col not in left]
+    return merged[columns]
+
+
+def synthetic_inputs(rows, seed=0):
+    """Tracking, position and security frames shaped like the MyDailyRecon inputs."""
+    rng = np.random.default_rng(seed)
+    accounts = np.char.add("ACC", rng.integers(0, max(rows // 50, 1), rows).astype(str))
+    securities = np.char.add(
+        "SEC", rng.integers(0, max(rows // 20, 1), rows).astype(str)
+    )
+    tracking = pd.DataFrame(
+        {
+            "Date": "2024-12-31",
+            "Account ID": accounts,
+            "Security ID": securities,
+            "Units - d1g1t": rng.normal(1000, 300, rows).round(4),
+            "Market Value - d1g1t": rng.normal(1e5, 3e4, rows).round(2),
+        }
+    ).drop_duplicates(["Date", "Account ID", "Security ID"])
+    position = tracking.sample(frac=0.9, random_state=seed).rename(
+        columns={
+            "Units - d1g1t": "Units - Custodian",
+            "Market Value - d1g1t": "Market Value - Custodian",
+        }
+    )
+    position["Security ID"] = position["Security ID"].where(
+        rng.random(len(position)) > 0.05, "NEW" + position["Security ID"]
+    )
+    position = position.drop_duplicates(["Date", "Account ID", "Security ID"])
+    security = pd.DataFrame({"Security ID": np.unique(securities)})
+    security["Security Type"] = rng.choice(["cs", "ca", "mf", "pe"], len(security))
+    return tracking, position, security
+
+
+def parity_and_benchmark(engine, rows, repeat=3):
+    """
+    Run the MyDailyRecon joins and an OARecon style join of two environments
+    on the engine and on pandas.
+    :return: (identical results, best time of the engine, best time of pandas)
+    """
+    tracking, position, security = synthetic_inputs(rows)
+    target = tracking.sample(frac=0.9, random_state=1)
+
+    def run(current):
+        start = time.perf_counter()
+        recon = current.merge(
+            encoded_outer_join(
+                current, tracking, position, ["Date", "Account ID", "Security ID"]
+            ),
+            security,
+            how="left",
+            on=["Security ID"],
+        )
+        environments = current.merge(
+            tracking,
+            target,
+            how="outer",
+            on=["Date", "Account ID", "Security ID"],
+            suffixes=["_base", "_target"],
+        )
+        return (recon, environments), time.perf_counter() - start
+
+    reference, engine_result = None, None
+    reference_times, engine_times = [], []
+    for _ in range(repeat):
+        reference, elapsed = run(PandasEngine())
+        reference_times.append(elapsed)
+        engine_result, elapsed = run(engine)
+        engine_times.append(elapsed)
+    try:
+        for expected, result in zip(reference, engine_result):
+            pd.testing.assert_frame_equal(
+                expected, result, check_dtype=False, check_index_type=False
+            )
+        identical = True
+    except AssertionError:
+        identical = False
+    return identical, min(engine_times), min(reference_times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check the DataFrame engines against pandas and time them"
+    )
+    parser.add_argument(
+        "-r", "--rows", dest="rows", type=int, default=100000, help="Tracking rows"
+    )
+    parser.add_argument(
+        "-e",
+        "--engines",
+        dest="engines",
+        type=str,
+        nargs="+",
+        default=["polars", "pyarrow"],
+        help="Engines to compare to pandas",
+    )
+    parser.add_argument(
+        "-n", "--repeat", dest="repeat", type=int, default=3, help="Runs per engine"
+    )
+    args = parser.parse_args()
+
+    for name in args.engines:
+        try:
+            engine = get_engine(name)
+        except InputValidationError as e:
+            print(e)
+            continue
+        identical, engine_time, pandas_time = parity_and_benchmark(
+            engine, args.rows, args.repeat
+        )
+        print(
+            f"{name}: {'identical to' if identical else 'DIFFERENT from'} pandas, "
+            f"{engine_time:.3f}s vs {pandas_time:.3f}s "
+            f"({pandas_time / engine_time:.1f}x) on {args.rows} rows"
+        )
@@ -1,6 +1,7 @@
 import awswrangler as wr
 import argparse
 import pandas as pd
+import s3_cache
 
 parser = argparse.ArgumentParser()
 parser.add_argument(
@@ -19,7 +20,7 @@ args.date = args.date.replace("-", "")
 custodian_file = (
     f"s3://d1g1t-custodian-data-us-east-1/apx/gresham/{args.date}/Transaction.csv"
 )
-custodian_data = pd.read_csv(custodian_file)
+custodian_data = s3_cache.read_csv(custodian_file)
 mapped_data_folder = (
     f"s3://d1g1t-dataloader-us/production/outputs/gresham/{args.date}/apx/"
 )
@@ -30,7 +31,7 @@ mapped_transaction_files = [
     if "transactions" in file and ".csv" in file
 ]
 mapped_transactions = pd.concat(
-    [pd.read_csv(file) for file in mapped_transaction_files]
+    [s3_cache.read_csv(file) for file in mapped_transaction_files]
 )
 
 mapped_transactions["TransactionGUID"] = mapped_transactions["Origin ID"].str[:-2]
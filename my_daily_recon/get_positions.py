@@ -1,12 +1,12 @@
-import os
 import pandas as pd
 import numpy as np
 import awswrangler as wr
+import s3_cache
+from recon_outputs import list_outputs, read_output
 
 output_folder = "my_daily_recon/outputs"
-output_files = os.listdir(output_folder)
-output_files.sort()
-most_recent_recon = pd.read_csv(f"{output_folder}/{output_files[-1]}")
+output_files = list_outputs(output_folder, "full_recon")
+most_recent_recon = read_output(output_files[-1])
 most_recent_recon.loc[most_recent_recon["Security ID"] == "USD", "Security ID"] = (
     "BC36B21F-D673-492F-8D1D-30956550D237"
 )
@@ -30,7 +30,7 @@ for file in position_files:
     if dated_folder >= "20250319":
         print(f"Processing dated folder: {dated_folder}")
         # Read the CSV file into a DataFrame
-        df = wr.s3.read_csv(file)
+        df = s3_cache.read_csv(file)
         df = (
             df[["AccountCode", "SecurityID", "Current", "MV_Local"]]
             .rename(
@@ -3,9 +3,37 @@ from configparser import ConfigParser
 import numpy as np
 import logging
 import argparse
+import json
+import os
+import sqlite3
+from functools import partial
+from multiprocess import Pool
+
+from tolerance import ToleranceEngine
+from recon_store import ReconStore, add_store_args
+from frame_engine import get_engine, add_engine_args, encoded_outer_join
+import s3_cache
+from content_hash import frame_digests
+from security_classes import classify
+from fetch_scheduler import FetchScheduler
+from stage_profiler import StageProfiler
+from recon_outputs import add_output_format_args, write_output
 
 LOG = logging.getLogger(__name__)
 
+RECON_KEYS = ["Date", "Account ID", "Security ID"]
+
+TRACKING_DTYPES = {
+    "date": str,
+    "account": str,
+    "instrument": str,
+    "scale": str,
+    "units": "float64",
+    "price": "float64",
+    "mv": "float64",
+    "is_dead": "category",
+}
+
 
 """
 The main purpose of this script is to generate a recon file according
@@ -33,8 +61,22 @@ The necessary inputs to run the code are:
 """
 
 
+def parse_input(read, read_args, stage_profile, local_path):
+    """
+    Parse step of an input: read its local copy with a profiler of its own,
+    whose stages are returned so they reach the parent from a parse process
+    """
+    profiler = StageProfiler(stage_profile)
+    return read(local_path, *read_args, profiler), profiler.stages
+
+
 class MyDailyRecon:
-    def __init__(self):
+    def __init__(self, argv=None, input_cache=None):
+        """
+        :param argv: command line arguments, sys.argv by default
+        :param input_cache: dict of parsed inputs shared with other recons,
+            keyed by input and file (see run_profiles.py)
+        """
         self.parser = argparse.ArgumentParser(description=__doc__)
 
         self.parser.add_argument(
@@ -55,7 +97,93 @@ class MyDailyRecon:
             help="Recon date (YYYY-MM-DD)",
         )
 
-        self.args = self.parser.parse_args()
+        self.parser.add_argument(
+            "-ed",
+            "--end_date",
+            dest="end_date",
+            type=str,
+            required=False,
+            help="Backfill every business day from --date to this date (YYYY-MM-DD)",
+        )
+
+        self.parser.add_argument(
+            "-w",
+            "--workers",
+            dest="workers",
+            type=int,
+            default=None,
+            required=False,
+            help="Processes used by the backfill (default: one per CPU)",
+        )
+
+        self.parser.add_argument(
+            "-cs",
+            "--chunk_size",
+            dest="chunk_size",
+            type=int,
+            default=500000,
+            required=False,
+            help="Rows of the tracking export read at once",
+        )
+
+        self.parser.add_argument(
+            "-iw",
+            "--io_workers",
+            dest="io_workers",
+            type=int,
+            default=4,
+            required=False,
+            help="Threads downloading the inputs concurrently",
+        )
+
+        self.parser.add_argument(
+            "-pp",
+            "--parse_processes",
+            dest="parse_processes",
+            type=int,
+            default=0,
+            required=False,
+            help="Processes parsing the inputs (default: parse in the download threads)",
+        )
+
+        self.parser.add_argument(
+            "-inc",
+            "--incremental",
+            dest="incremental",
+            action="store_true",
+            default=False,
+            help="Only recompute the accounts whose tracking or positions changed since the last run",
+        )
+
+        self.parser.add_argument(
+            "-fe",
+            "--full_every",
+            dest="full_every",
+            type=int,
+            default=5,
+            required=False,
+            help="With --incremental, recompute everything and check the incremental result every N runs",
+        )
+
+        self.parser.add_argument(
+            "-sp",
+            "--stage_profile",
+            dest="stage_profile",
+            action="store_true",
+            default=False,
+            help="Save the time, CPU, memory and rows of each stage to a json profile",
+        )
+
+        add_output_format_args(self.parser)
+        add_store_args(self.parser)
+        add_engine_args(self.parser)
+
+        self.args = self.parser.parse_args(argv)
+        if self.args.end_date and (self.args.incremental or self.args.stage_profile):
+            self.parser.error(
+                "--incremental and --stage_profile are not supported with --end_date"
+            )
+        self.input_cache = {} if input_cache is None else input_cache
 
         constants = ConfigParser()
         constants.read("my_daily_recon/inputs/my_daily_recon.ini")
@@ -68,23 +196,52 @@ class MyDailyRecon:
             self.args.profile.upper(), "SECURITY_MASTER_FILE"
         )
         self.usd_security = constants.get(self.args.profile.upper(), "USD_SECURITY")
-        threshold_str = constants.get(self.args.profile.upper(), "THRESHOLD")
-        self.threshold = dict(item.split("=") for item in threshold_str.split(","))
+        self.threshold = constants.get(self.args.profile.upper(), "THRESHOLD")
+        self.tolerance = ToleranceEngine.from_string(self.threshold, decimals=2)
+        self.engine = get_engine(self.args.engine)
+        self.profiler = StageProfiler(self.args.stage_profile)
 
-    def get_tracking(self):
+    @staticmethod
+    def filter_tracking(tracking):
         """
-        Get the tracking file from S3
+        Keep the live positions of the regular accounts
         """
-        tracking = pd.read_csv(self.tracking_file)
         tracking.loc[tracking["instrument"] == "USD", "mv"] = tracking.loc[
             tracking["instrument"] == "USD", "units"
         ]
         tracking = tracking[tracking["is_dead"] == "f"]
         tracking = tracking[~tracking["account"].str.contains("_")]
         tracking = tracking.dropna(subset=["units", "mv"], how="all")
-        tracking = tracking[
+        return tracking[
             ["date", "account", "instrument", "scale", "units", "price", "mv"]
         ]
+
+    def get_tracking(self):
+        """
+        Get the tracking file from S3
+        """
+        return self.read_tracking(
+            self.tracking_file, self.args.chunk_size, self.profiler
+        )
+
+    @staticmethod
+    def read_tracking(path, chunk_size, profiler):
+        """
+        Read the tracking export, reading only the needed columns and
+        filtering each chunk before it is kept
+        """
+        with profiler.stage("tracking read") as stage:
+            chunks = s3_cache.read_csv(
+                path,
+                usecols=list(TRACKING_DTYPES),
+                dtype=TRACKING_DTYPES,
+                chunksize=chunk_size,
+            )
+            tracking = pd.concat(
+                [MyDailyRecon.filter_tracking(chunk) for chunk in chunks],
+                ignore_index=True,
+            )
+            stage["rows"] = len(tracking)
         tracking.rename(
             columns={
                 "date": "Date",
@@ -99,13 +256,23 @@ class MyDailyRecon:
         )
         return tracking
 
-    def get_position(self):
+    def dated_file(self, template, date=None):
+        return template.replace("YYYYMMDD", (date or self.args.date).replace("-", ""))
+
+    def get_position(self, date=None):
         """
         Get the position file from S3
         """
-        dte = self.args.date.replace("-", "")
-        self.position_file = self.position_file.replace("YYYYMMDD", dte)
-        pos = pd.read_csv(self.position_file)
+        return self.read_position(
+            self.dated_file(self.position_file, date), self.usd_security, self.profiler
+        )
+
+    @staticmethod
+    def read_position(path, usd_security, profiler):
+        """
+        Read a position file, summing the lots of each position
+        """
+        pos = s3_cache.read_csv(path)
         pos.rename(
             columns={
                 "AccountCode": "Account ID",
@@ -127,27 +294,38 @@ class MyDailyRecon:
             ]
         ]
         pos["Price - Custodian"] = pos["Price - Custodian"].fillna(0)
-        pos = (
-            pos.groupby(
-                ["Date", "Account ID", "Security ID", "Price - Custodian"],
-                as_index=False,
+        with profiler.stage("position groupby", input_rows=len(pos)) as stage:
+            pos = (
+                pos.groupby(
+                    ["Date", "Account ID", "Security ID", "Price - Custodian"],
+                    as_index=False,
+                )
+                .sum()
+                .reset_index(drop=True)
             )
-            .sum()
-            .reset_index(drop=True)
-        )
-        pos["Security ID"] = pos["Security ID"].replace({self.usd_security: "USD"})
+            stage["rows"] = len(pos)
+        pos["Security ID"] = pos["Security ID"].replace({usd_security: "USD"})
         return pos
 
-    def get_security(self):
+    def get_security(self, date=None):
         """
         Get the security file from S3
         """
-        dte = self.args.date.replace("-", "")
-        self.security_file = self.security_file.replace("YYYYMMDD", dte)
-        sec_master = pd.read_csv(
-            self.security_file,
-            usecols=["SecurityID", "SecurityName", "Symbol", "SecurityTypeCode"],
+        return self.read_security(
+            self.dated_file(self.security_file, date), self.profiler
         )
+
+    @staticmethod
+    def read_security(path, profiler):
+        """
+        Read a security master file
+        """
+        with profiler.stage("security read") as stage:
+            sec_master = s3_cache.read_csv(
+                path,
+                usecols=["SecurityID", "SecurityName", "Symbol", "SecurityTypeCode"],
+            )
+            stage["rows"] = len(sec_master)
         sec_master.rename(
             columns={
                 "SecurityID": "Security ID",
@@ -160,11 +338,62 @@ class MyDailyRecon:
 
     def get_s3_data(self):
         """
-        Get the data from S3
+        Get the data from S3, downloading and parsing the files concurrently.
+        Inputs already in the input cache are reused.
         """
-        tracking = self.get_tracking()
-        position = self.get_position()
-        security = self.get_security()
+        scheduler = FetchScheduler(self.args.io_workers, self.args.parse_processes)
+        keys, inputs = {}, {}
+        for name, path, read, read_args in [
+            (
+                "tracking",
+                self.tracking_file,
+                MyDailyRecon.read_tracking,
+                (self.args.chunk_size,),
+            ),
+            (
+                "position",
+                self.dated_file(self.position_file),
+                MyDailyRecon.read_position,
+                (self.usd_security,),
+            ),
+            (
+                "security",
+                self.dated_file(self.security_file),
+                MyDailyRecon.read_security,
+                (),
+            ),
+        ]:
+            # the USD security is mapped while parsing the positions
+            keys[name] = (name, path, self.usd_security if name == "position" else None)
+            if keys[name] in self.input_cache:
+                LOG.info(f"Reusing the parsed {name} file {path}")
+                inputs[name] = self.input_cache[keys[name]]
+                continue
+            # the parse step only gets the local copy and plain arguments, so
+            # nothing of the recon is pickled when it runs in a process
+            scheduler.add(
+                name,
+                partial(s3_cache.fetch, path),
+                partial(parse_input, read, read_args, self.args.stage_profile),
+            )
+        with self.profiler.stage("inputs") as stage:
+            loaded = scheduler.run()
+            stage["rows"] = {name: len(frame) for name, (frame, _) in loaded.items()}
+        for name, (frame, stages) in loaded.items():
+            self.profiler.extend(stages)
+            self.input_cache[keys[name]] = inputs[name] = frame
+        self.profiler.add(
+            "input_loads",
+            {
+                name: {step: round(seconds, 4) for step, seconds in timing.items()}
+                for name, timing in scheduler.timings.items()
+            },
+        )
+        tracking, position, security = (
+            inputs["tracking"],
+            inputs["position"],
+            inputs["security"],
+        )
 
         # Remove duplicates
         tracking = tracking.drop_duplicates()
@@ -178,21 +407,54 @@ class MyDailyRecon:
 
         return tracking, position, security
 
+    def duplicate_keys(self, tracking, position, security):
+        """
+        Keys found more than once in an input, which multiply the joined rows
+        """
+        report = []
+        for source, frame, keys in [
+            ("Tracking", tracking, RECON_KEYS),
+            ("Position", position, RECON_KEYS),
+            ("Security", security, ["Security ID"]),
+        ]:
+            counts = frame.groupby(keys, dropna=False).size()
+            counts = counts[counts > 1].rename("Rows").reset_index()
+            counts.insert(0, "Source", source)
+            report.append(counts)
+        report = pd.concat(report, ignore_index=True)
+        # keys repeated on both sides of the outer join give a cartesian product
+        both = report[report["Source"] != "Security"].duplicated(RECON_KEYS, keep=False)
+        report["Many to Many"] = both.reindex(report.index, fill_value=False)
+        return report
+
+    def report_duplicates(self, report, current_date):
+        if report.empty:
+            return
+        report_file = f"my_daily_recon/outputs/{current_date}_{self.client}_{self.env}_duplicate_keys.csv"
+        report.to_csv(report_file, index=False)
+        LOG.warning(
+            f"{len(report)} duplicated keys in the inputs "
+            f"({', '.join(report['Source'].unique())}), see {report_file}"
+        )
+
     def merge_files(self, tracking, position, security):
-        recon = tracking.merge(position, how="outer").merge(security, how="left")
+        """
+        Outer join of tracking and positions on integer encoded
+        (Date, Account ID, Security ID) indexes, then the security data on
+        Security ID
+        """
+        duplicates = self.duplicate_keys(tracking, position, security)
+
+        recon = encoded_outer_join(self.engine, tracking, position, RECON_KEYS)
+        if len(recon):
+            self.report_duplicates(duplicates, recon["Date"].iloc[0])
+
+        recon = self.engine.merge(recon, security, how="left", on=["Security ID"])
         recon.loc[recon["Security ID"] == "USD", "Security Name"] = "US Dollar"
         recon.loc[recon["Security ID"] == "USD", "Security Type"] = "ca"
         recon.loc[recon["Security ID"] == "USD", "Symbol"] = "cash"
 
-        recon["Category"] = "Marketable"
-        recon.loc[recon["Security Type"] == "ca", "Category"] = "Cashlike"
-        recon.loc[recon["Security Type"].isin(["pe", "rp"]), "Category"] = "True PE"
-        recon.loc[
-            recon["Security Type"].isin(
-                ["en", "hf", "hp", "lp", "oa", "pl", "pp", "zp"]
-            ),
-            "Category",
-        ] = "Non Marketable"
+        recon["Category"] = classify(recon["Security Type"])
         return recon
 
     def add_recon_columns(self, recon):
@@ -223,13 +485,10 @@ class MyDailyRecon:
             0
         )
 
-        for analytic in ["Units", "Price", "Market Value"]:
-            recon[f"{analytic} - Diff"] = round(
-                abs(recon[f"{analytic} - d1g1t"] - recon[f"{analytic} - Custodian"]), 2
-            )
-            recon[f"{analytic} - Reconciled"] = recon[f"{analytic} - Diff"] < float(
-                self.threshold[analytic]
-            )
+        result = self.tolerance.compare_frame(
+            recon, ["Units", "Price", "Market Value"], "{} - d1g1t", "{} - Custodian"
+        )
+        result.assign(recon)
 
         return recon
 
@@ -252,10 +511,15 @@ class MyDailyRecon:
         return recon
 
     def generate_recon(self, tracking, position, security):
-        recon = self.merge_files(tracking, position, security)
-        recon = self.add_recon_columns(recon)
-        recon = self.recon_adjustments(recon)
-        recon = self.filter_empty_rows(recon)
+        with self.profiler.stage("merge") as stage:
+            recon = self.merge_files(tracking, position, security)
+            stage["rows"] = len(recon)
+        with self.profiler.stage("tolerance", rows=len(recon)):
+            recon = self.add_recon_columns(recon)
+        with self.profiler.stage("adjustments") as stage:
+            recon = self.recon_adjustments(recon)
+            recon = self.filter_empty_rows(recon)
+            stage["rows"] = len(recon)
         return recon
 
     def filter_empty_rows(self, recon):
@@ -277,17 +541,27 @@ class MyDailyRecon:
             recon["Units - Reconciled"] & recon["Market Value - Reconciled"]
         )
         recon = recon[~recon["reconciled"]]
-        recon = recon.sort_values(
-            ["Account ID", "Category", "Units - Diff", "Security Name", "Security ID"]
-        )
-        recon.to_csv(
-            f"my_daily_recon/outputs/{current_date}_{self.client}_{self.env}_breaks_only.csv",
-            index=False,
-        )
+        with self.profiler.stage("sort breaks", rows=len(recon)):
+            recon = recon.sort_values(
+                [
+                    "Account ID",
+                    "Category",
+                    "Units - Diff",
+                    "Security Name",
+                    "Security ID",
+                ]
+            )
+        with self.profiler.stage("write breaks", rows=len(recon)):
+            write_output(
+                recon,
+                f"my_daily_recon/outputs/{current_date}_{self.client}_{self.env}_breaks_only",
+                self.args.output_formats,
+            )
 
-    def output_file(self, recon):
+    def output_file(self, recon, store=True):
         """
         Save the reconciliation file
+        :param store: also save it to --results_db, if given
         """
         recon = recon[
             [
@@ -313,11 +587,178 @@ class MyDailyRecon:
             ]
         ]
         current_date = recon.iloc[0, 0]
-        recon = recon.sort_values(["Account ID", "Security ID"])
-        recon_file = f"my_daily_recon/outputs/{current_date}_{self.client}_{self.env}_full_recon.csv"
-        recon.to_csv(recon_file, index=False)
+        with self.profiler.stage("sort full recon", rows=len(recon)):
+            recon = recon.sort_values(["Account ID", "Security ID"])
+        recon_file = (
+            f"my_daily_recon/outputs/{current_date}_{self.client}_{self.env}_full_recon"
+        )
+        with self.profiler.stage("write full recon", rows=len(recon)):
+            write_output(recon, recon_file, self.args.output_formats)
         self.split_recon(recon, current_date)
         LOG.info(f"Reconciliation files saved to my_daily_recon/outputs/")
+        if store and self.args.results_db:
+            with self.profiler.stage("results store", rows=len(recon)):
+                self.store_results(recon, current_date)
+
+    def store_results(self, recon, current_date):
+        """
+        Save the reconciliation to the results store
+        """
+        store = ReconStore(self.args.results_db)
+        run_id = store.start_run(
+            "my_daily_recon",
+            f"{self.client}_{self.env}",
+            "d1g1t",
+            "Custodian",
+            current_date,
+        )
+        rows = store.ingest_frame(
+            run_id,
+            recon,
+            ["Units", "Market Value", "Price"],
+            "{} - d1g1t",
+            "{} - Custodian",
+            security_id="Security ID",
+        )
+        store.close()
+        LOG.info(f"{rows} results saved to {self.args.results_db} (run {run_id})")
+
+    @property
+    def state_file(self):
+        return f"my_daily_recon/outputs/{self.client}_{self.env}_incremental_state.json"
+
+    @property
+    def state_recon_file(self):
+        return f"my_daily_recon/outputs/{self.client}_{self.env}_incremental_recon.csv"
+
+    def account_digests(self, tracking, position):
+        """
+        Digest of the tracking and position rows of each account. The recon
+        date is blanked out so that unchanged holdings hash the same every day.
+        """
+        tracking_digests, position_digests = (
+            frame_digests(
+                frame.assign(Date=frame["Date"].where(frame["Date"] != self.args.date)),
+                "Account ID",
+            )
+            for frame in [tracking, position]
+        )
+        return {
+            account: f"{tracking_digests.get(account)}|{position_digests.get(account)}"
+            for account in set(tracking_digests) | set(position_digests)
+        }
+
+    def context_digest(self, security):
+        """
+        Digest of everything besides the account rows that the recon depends on
+        """
+        security_digest = frame_digests(security.assign(All=""), "All").get("", "")
+        return f"{self.threshold}|{self.usd_security}|{security_digest}"
+
+    def load_state(self):
+        if not (
+            os.path.exists(self.state_file) and os.path.exists(self.state_recon_file)
+        ):
+            return None
+        with open(self.state_file) as f:
+            state = json.load(f)
+        state["recon"] = pd.read_csv(
+            self.state_recon_file,
+            dtype={
+                column: str
+                for column in RECON_KEYS
+                + ["Scale", "Security Name", "Symbol", "Security Type", "Category"]
+            },
+            # the default parser can be off by one ulp, the reused rows must be exact
+            float_precision="round_trip",
+        )
+        return state
+
+    def save_state(self, digests, context, recon, runs):
+        with open(self.state_file, "w") as f:
+            json.dump(
+                {
+                    "date": self.args.date,
+                    "context": context,
+                    "runs": runs,
+                    "digests": digests,
+                },
+                f,
+            )
+        recon.to_csv(self.state_recon_file, index=False)
+
+    def verify_incremental(self, incremental, full):
+        """
+        Log the accounts where the incremental recon differs from the full one
+        """
+        columns = list(full.columns)
+        expected = frame_digests(full[columns].astype(str), "Account ID")
+        found = frame_digests(incremental[columns].astype(str), "Account ID")
+        mismatches = sorted(
+            account
+            for account in set(expected) | set(found)
+            if expected.get(account) != found.get(account)
+        )
+        if mismatches:
+            LOG.error(
+                f"Incremental recon differs from the full recon for "
+                f"{len(mismatches)} accounts: {', '.join(mismatches[:20])}"
+            )
+        else:
+            LOG.info("Incremental recon matches the full recon")
+        return mismatches
+
+    def incremental_recon(self, tracking, position, security):
+        """
+        Recompute the accounts whose tracking or position rows changed since the
+        last run and reuse the stored recon rows of the others. Every
+        --full_every runs, or when the security master or the thresholds change,
+        the whole recon is recomputed, and checked against the incremental one.
+        """
+        with self.profiler.stage("load incremental state"):
+            state = self.load_state()
+        with self.profiler.stage("account digests") as stage:
+            digests = self.account_digests(tracking, position)
+            context = self.context_digest(security)
+            stage["rows"] = len(digests)
+
+        recon = None
+        if state is not None and state["context"] == context:
+            changed = {
+                account
+                for account, digest in digests.items()
+                if state["digests"].get(account) != digest
+            }
+            LOG.info(f"Recomputing {len(changed)}/{len(digests)} accounts")
+            reused = state["recon"]
+            reused = reused[
+                reused["Account ID"].astype(str).isin(set(digests) - changed)
+            ].copy()
+            reused.loc[reused["Date"] == state["date"], "Date"] = self.args.date
+            recon = pd.concat(
+                [
+                    reused,
+                    self.generate_recon(
+                        tracking[tracking["Account ID"].astype(str).isin(changed)],
+                        position[position["Account ID"].astype(str).isin(changed)],
+                        security,
+                    ),
+                ],
+                ignore_index=True,
+            )
+
+        if recon is None or state["runs"] + 1 >= self.args.full_every:
+            LOG.info("Recomputing all accounts")
+            full = self.generate_recon(tracking, position, security)
+            if recon is not None:
+                self.verify_incremental(recon[full.columns], full)
+            recon, runs = full, 0
+        else:
+            runs = state["runs"] + 1
+
+        with self.profiler.stage("save incremental state", rows=len(recon)):
+            self.save_state(digests, context, recon, runs)
+        return recon
 
     def run(self):
         """
@@ -329,14 +770,84 @@ class MyDailyRecon:
         track, pos, sec_master = self.get_s3_data()
 
         # Create the reconciliation file
-        recon = self.generate_recon(track, pos, sec_master)
+        if self.args.incremental:
+            recon = self.incremental_recon(track, pos, sec_master)
+        else:
+            recon = self.generate_recon(track, pos, sec_master)
 
         # Save the reconciliation file
         self.output_file(recon)
 
-        pass
+        self.profiler.save(
+            f"my_daily_recon/outputs/{self.args.date}_{self.client}_{self.env}_profile.json",
+            profile=self.args.profile,
+            date=self.args.date,
+            client=self.client,
+            environment=self.env,
+            engine=self.args.engine,
+            incremental=self.args.incremental,
+        )
+        return recon
+
+    def run_date(self, date, tracking):
+        """
+        Generate and save the recon of one backfill date. The results store
+        is left to the parent process, the only writer of the database.
+        :return: (date, error, recon to store or None)
+        """
+        try:
+            position = self.get_position(date).drop_duplicates().dropna(how="all")
+            security = self.get_security(date).drop_duplicates().dropna(how="all")
+            recon = self.generate_recon(tracking, position, security)
+            self.output_file(recon, store=False)
+        except Exception as e:
+            return date, f"{type(e).__name__}: {e}", None
+        return date, None, recon if self.args.results_db else None
+
+    def backfill(self):
+        """
+        Run the recon for every business day between --date and --end_date.
+        The tracking file is read once and each date runs in its own process,
+        so a failing date does not stop the others. With --results_db, the
+        results are stored by this process as the dates complete.
+        """
+        dates = pd.bdate_range(self.args.date, self.args.end_date).strftime("%Y-%m-%d")
+        LOG.info(f"Backfilling {len(dates)} dates")
+        tracking = self.get_tracking().drop_duplicates().dropna(how="all")
+        tasks = [(date, tracking[tracking["Date"] == date]) for date in dates]
+        for date, date_tracking in tasks:
+            if date_tracking.empty:
+                LOG.warning(f"No tracking data for {date}")
+
+        failures = {}
+        with Pool(self.args.workers) as pool:
+            for date, error, recon in pool.imap_unordered(
+                lambda task: self.run_date(*task), tasks
+            ):
+                if error:
+                    failures[date] = error
+                    LOG.error(f"Recon for {date} failed")
+                    continue
+                LOG.info(f"Recon for {date} saved")
+                if recon is None:
+                    continue
+                try:
+                    self.store_results(recon, date)
+                except sqlite3.Error as e:
+                    failures[date] = (
+                        f"outputs saved, results store failed: {type(e).__name__}: {e}"
+                    )
+                    LOG.error(f"Results of {date} not stored")
+
+        LOG.info(f"Backfill done: {len(dates) - len(failures)}/{len(dates)} dates")
+        for date in sorted(failures):
+            LOG.error(f"{date}: {failures[date]}")
+        return failures
 
 
 if __name__ == "__main__":
     runner = MyDailyRecon()
-    runner.run()
+    if runner.args.end_date:
+        runner.backfill()
+    else:
+        runner.run()
@@ -1,5 +1,6 @@
-import os
 import awswrangler as wr
+import s3_cache
+from recon_outputs import list_outputs, read_output
 import pandas as pd
 from configparser import ConfigParser
 import numpy as np
@@ -47,11 +48,9 @@ class ReconDailyDelta:
         Get the most recent reconciliation files from S3.
         """
         outpuyt_dir = "my_daily_recon/outputs/"
-        files = os.listdir(outpuyt_dir)
-        files = [file for file in files if "breaks_only.csv" in file]
-        files.sort()
-        current = pd.read_csv(os.path.join(outpuyt_dir, files[-1]))
-        previous = pd.read_csv(os.path.join(outpuyt_dir, files[-2]))
+        files = list_outputs(outpuyt_dir, "breaks_only")
+        current = read_output(files[-1])
+        previous = read_output(files[-2])
         return current, previous
 
     def compare_recon_files(self, current, previous):
@@ -87,7 +86,7 @@ class ReconDailyDelta:
         for file in transaction_files:
             counter += 1
             logging.info(f"Processing file {counter}/{len(transaction_files)}: {file}")
-            df = wr.s3.read_csv(file)
+            df = s3_cache.read_csv(file)
             df = df.merge(filtering_df, how="inner")
             df["source"] = file.split("/")[5]
             dfl.append(df)
@@ -118,7 +117,7 @@ class ReconDailyDelta:
         for file in position_files:
             counter += 1
             logging.info(f"Processing file {counter}/{len(position_files)}: {file}")
-            df = wr.s3.read_csv(file)
+            df = s3_cache.read_csv(file)
             df = df.merge(filtering_df, how="inner")
             df["source"] = file.split("/")[5]
             dfl.append(df)
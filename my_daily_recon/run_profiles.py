@@ -0,0 +1,171 @@
+import argparse
+import logging
+import time
+from configparser import ConfigParser
+
+import pandas as pd
+from multiprocess import Pool
+
+from my_daily_recon.my_daily_recon import MyDailyRecon
+
+LOG = logging.getLogger(__name__)
+
+"""
+Run the daily recon of several profiles of my_daily_recon.ini at once.
+
+Profiles are grouped by custodian, i.e. by their position and security master
+files. Each group runs in one process of a bounded pool, where the inputs are
+parsed once and shared by the recons of its profiles; groups run
+concurrently. A failing profile does not stop the others, and a consolidated
+status summary is printed and saved at the end. Run it as a module from the
+repository root:
+
+    python -m my_daily_recon.run_profiles -d 2025-03-19
+    python -m my_daily_recon.run_profiles -d 2025-03-19 -p gresham other -w 4 -- -of parquet csv
+
+Arguments after -- are passed on to MyDailyRecon for every profile.
+"""
+
+INI_FILE = "my_daily_recon/inputs/my_daily_recon.ini"
+
+
+def profile_groups(profiles):
+    """
+    Profiles grouped by their custodian files, in the order of the profiles
+    """
+    constants = ConfigParser()
+    constants.read(INI_FILE)
+    groups = {}
+    for profile in profiles:
+        section = profile.upper()
+        if not constants.has_section(section):
+            # left to fail in its own group, reported in the summary
+            groups[(profile,)] = [profile]
+            continue
+        key = (
+            constants.get(section, "POSITION_FILE"),
+            constants.get(section, "SECURITY_MASTER_FILE"),
+        )
+        groups.setdefault(key, []).append(profile)
+    return list(groups.values())
+
+
+def run_group(profiles, date, recon_args):
+    """
+    Run the recon of profiles sharing their custodian files, one after the other
+    :return: list of status dicts, one per profile
+    """
+    input_cache = {}
+    statuses = []
+    for profile in profiles:
+        start = time.perf_counter()
+        status = {"Profile": profile, "Client": None, "Environment": None}
+        try:
+            recon = MyDailyRecon(
+                ["-p", profile, "-d", date] + list(recon_args), input_cache
+            )
+            status["Client"], status["Environment"] = recon.client, recon.env
+            result = recon.run()
+            reconciled = (
+                result["Units - Reconciled"] & result["Market Value - Reconciled"]
+            )
+            status.update(
+                {
+                    "Status": "ok",
+                    "Rows": len(result),
+                    "Breaks": int((~reconciled).sum()),
+                    "Error": None,
+                }
+            )
+        except (Exception, SystemExit) as e:
+            LOG.exception(f"Recon of profile {profile} failed")
+            status.update(
+                {
+                    "Status": "failed",
+                    "Rows": None,
+                    "Breaks": None,
+                    "Error": f"{type(e).__name__}: {e}",
+                }
+            )
+        status["Seconds"] = round(time.perf_counter() - start, 2)
+        status["Shared Inputs"] = len(profiles) > 1
+        statuses.append(status)
+    return statuses
+
+
+def run_profiles(profiles, date, recon_args=(), workers=None):
+    """
+    :return: status summary dataframe, one row per profile
+    """
+    groups = profile_groups(profiles)
+    LOG.info(
+        f"Running {len(profiles)} profiles in {len(groups)} custodian groups "
+        f"on {date}"
+    )
+    statuses = []
+    with Pool(workers) as pool:
+        for group_statuses in pool.imap_unordered(
+            lambda group: run_group(group, date, recon_args), groups
+        ):
+            for status in group_statuses:
+                LOG.info(f"Profile {status['Profile']}: {status['Status']}")
+            statuses.extend(group_statuses)
+    order = {profile: i for i, profile in enumerate(profiles)}
+    summary = pd.DataFrame(
+        sorted(statuses, key=lambda status: order[status["Profile"]])
+    )
+    return summary.astype({"Rows": "Int64", "Breaks": "Int64"})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run the daily recon of several profiles concurrently"
+    )
+    parser.add_argument(
+        "-d",
+        "--date",
+        dest="date",
+        type=str,
+        required=True,
+        help="Recon date (YYYY-MM-DD)",
+    )
+    parser.add_argument(
+        "-p",
+        "--profiles",
+        dest="profiles",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Profiles to run (default: every profile of the ini file)",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        type=int,
+        default=None,
+        help="Processes running custodian groups at once (default: one per CPU)",
+    )
+    parser.add_argument(
+        "recon_args",
+        nargs=argparse.REMAINDER,
+        help="Arguments passed on to MyDailyRecon, after --",
+    )
+    args = parser.parse_args()
+
+    profiles = args.profiles
+    if profiles is None:
+        constants = ConfigParser()
+        constants.read(INI_FILE)
+        profiles = constants.sections()
+    recon_args = [arg for arg in args.recon_args if arg != "--"]
+
+    summary = run_profiles(profiles, args.date, recon_args, args.workers)
+    summary_file = f"my_daily_recon/outputs/{args.date}_run_profiles_summary.csv"
+    summary.to_csv(summary_file, index=False)
+    print(summary.to_string(index=False))
+    failed = (summary["Status"] != "ok").sum()
+    print(
+        f"{len(summary) - failed}/{len(summary)} profiles reconciled, "
+        f"summary saved to {summary_file}"
+    )
@@ -0,0 +1,114 @@
+import os
+import pandas as pd
+
+from utils import InputValidationError
+
+"""
+Output files of the recon scripts in several formats.
+
+A recon output is written once per requested format next to each other,
+e.g. 2025-03-19_gresham_production_full_recon.parquet and .csv:
+
+    csv      plain text export, for people and spreadsheets
+    parquet  typed columns, zstd compressed (requires pyarrow)
+    feather  typed columns, zstd compressed, fastest to read back (requires pyarrow)
+
+Writing an output removes its files in the formats not written, so all the
+files of an output always come from the same run. Readers go through
+read_output, which prefers a columnar file over the csv of the same output,
+so downstream scripts skip the csv type inference whenever one was written.
+"""
+
+OUTPUT_FORMATS = ["csv", "parquet", "feather"]
+
+# preference of the readers
+READ_ORDER = ["feather", "parquet", "csv"]
+
+
+def columnar_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def add_output_format_args(parser):
+    parser.add_argument(
+        "-of",
+        "--output_formats",
+        dest="output_formats",
+        type=str,
+        nargs="+",
+        default=["csv"],
+        choices=OUTPUT_FORMATS,
+        help="Formats the outputs are written in (csv, parquet, feather)",
+    )
+
+
+def write_output(df, stem, formats=("csv",)):
+    """
+    Write a dataframe as {stem}.{format} for each format, and remove the
+    files of the other formats left by a previous run of the same output.
+    :return: list of the written files
+    """
+    if set(formats) - {"csv"} and not columnar_available():
+        raise InputValidationError("Parquet and feather outputs require pyarrow")
+    files = []
+    for output_format in formats:
+        file_path = f"{stem}.{output_format}"
+        if output_format == "csv":
+            df.to_csv(file_path, index=False)
+        elif output_format == "parquet":
+            df.to_parquet(file_path, index=False, compression="zstd")
+        elif output_format == "feather":
+            df.reset_index(drop=True).to_feather(file_path, compression="zstd")
+        else:
+            raise InputValidationError(f"Unknown output format {output_format}")
+        files.append(file_path)
+    for output_format in set(OUTPUT_FORMATS) - set(formats):
+        stale_path = f"{stem}.{output_format}"
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+    return files
+
+
+def split_output(file_name):
+    """(stem, format) of an output file name, format None if unknown."""
+    stem, ext = os.path.splitext(file_name)
+    output_format = ext.lstrip(".")
+    return (
+        (stem, output_format) if output_format in OUTPUT_FORMATS else (file_name, None)
+    )
+
+
+def read_output(stem):
+    """
+    Read an output, from its columnar file when there is one.
+    :param stem: path without extension, or the path of any of its files
+    """
+    stem = split_output(stem)[0]
+    formats = READ_ORDER if columnar_available() else ["csv"]
+    for output_format in formats:
+        file_path = f"{stem}.{output_format}"
+        if not os.path.exists(file_path):
+            continue
+        if output_format == "csv":
+            return pd.read_csv(file_path)
+        if output_format == "parquet":
+            return pd.read_parquet(file_path)
+        return pd.read_feather(file_path)
+    raise FileNotFoundError(f"No output found for {stem}")
+
+
+def list_outputs(folder, kind):
+    """
+    Sorted stems of the outputs of a kind in a folder, whatever their
+    formats, e.g. list_outputs("my_daily_recon/outputs", "full_recon")
+    """
+    stems = set()
+    for file_name in os.listdir(folder):
+        stem, output_format = split_output(file_name)
+        if output_format and stem.endswith(f"_{kind}"):
+            stems.add(os.path.join(folder, stem))
+    return sorted(stems)
@@ -0,0 +1,317 @@
+import argparse
+import datetime
+import logging
+import sqlite3
+import numpy as np
+import pandas as pd
+
+LOG = logging.getLogger(__name__)
+
+"""
+Local SQLite store of recon results.
+
+Each run of MyDailyRecon, OARecon or NAVRegression can be ingested as one row
+of the 'runs' table plus one row per recon row and metric in 'results':
+
+    date, entity_id, security_id, metric, left_value, right_value, diff, reconciled
+
+where left and right are the two sides compared (d1g1t/Custodian, base/target
+environment, target/base version) and diff is left - right. Results are
+indexed on entity and date, date, security and run, so lookups such as the
+breaks of one account over the last 30 days do not need to reload any csv:
+
+    python recon_store.py -e ACC123 -ld 30
+    python recon_store.py -sec AAPL -src my_daily_recon -all
+    python recon_store.py --runs
+"""
+
+DEFAULT_DB = "recon_results.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    label TEXT,
+    left_label TEXT,
+    right_label TEXT,
+    run_date TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    date TEXT,
+    entity_id TEXT,
+    security_id TEXT,
+    metric TEXT NOT NULL,
+    left_value REAL,
+    right_value REAL,
+    diff REAL,
+    reconciled INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_entity_date ON results (entity_id, date);
+CREATE INDEX IF NOT EXISTS results_date ON results (date);
+CREATE INDEX IF NOT EXISTS results_security_date ON results (security_id, date);
+CREATE INDEX IF NOT EXISTS results_run ON results (run_id);
+"""
+
+
+class ReconStore:
+    def __init__(self, path=DEFAULT_DB):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def start_run(
+        self, source, label=None, left_label=None, right_label=None, run_date=None
+    ):
+        """
+        Register a recon run.
+        :return: run_id to ingest the results with
+        """
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (source, label, left_label, right_label, run_date, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    source,
+                    label,
+                    left_label,
+                    right_label,
+                    None if run_date is None else str(run_date),
+                    datetime.datetime.now().isoformat(timespec="seconds"),
+                ),
+            )
+        return cursor.lastrowid
+
+    def ingest(self, run_id, keys, metrics, left, right, diff, reconciled):
+        """
+        Store (rows x metrics) recon arrays, one result row per recon row and metric.
+        :param keys: dataframe with the 'date', 'entity_id' and optionally
+            'security_id' of the recon rows
+        """
+        left = np.asarray(left, dtype=float)
+        n_rows, n_metrics = left.shape
+        results = pd.DataFrame(
+            {
+                "run_id": run_id,
+                "date": np.repeat(keys["date"].astype(str).to_numpy(), n_metrics),
+                "entity_id": np.repeat(
+                    keys["entity_id"].astype(str).to_numpy(), n_metrics
+                ),
+                "security_id": (
+                    np.repeat(keys["security_id"].astype(str).to_numpy(), n_metrics)
+                    if "security_id" in keys
+                    else None
+                ),
+                "metric": np.tile(list(metrics), n_rows),
+                "left_value": left.ravel(),
+                "right_value": np.asarray(right, dtype=float).ravel(),
+                "diff": np.asarray(diff, dtype=float).ravel(),
+                "reconciled": np.asarray(reconciled, dtype=bool).ravel().astype(int),
+            }
+        )
+        with self.connection:
+            results.to_sql("results", self.connection, if_exists="append", index=False)
+        return len(results)
+
+    def ingest_frame(
+        self,
+        run_id,
+        df,
+        metrics,
+        left,
+        right,
+        reconciled="{} - Reconciled",
+        date="Date",
+        entity_id="Account ID",
+        security_id=None,
+    ):
+        """
+        Store a recon dataframe with one column per side and metric, e.g.
+        ingest_frame(run_id, recon, ["Units"], "{} - d1g1t", "{} - Custodian").
+        The diff is taken as left - right from those columns, whatever diff
+        columns (absolute, rounded) the recon writes
+        """
+        keys = {"date": df[date], "entity_id": df[entity_id]}
+        if security_id:
+            keys["security_id"] = df[security_id]
+
+        def values(fmt):
+            return df[[fmt.format(metric) for metric in metrics]].to_numpy()
+
+        left_values = values(left).astype(float)
+        right_values = values(right).astype(float)
+        return self.ingest(
+            run_id,
+            pd.DataFrame(keys),
+            metrics,
+            left_values,
+            right_values,
+            left_values - right_values,
+            values(reconciled),
+        )
+
+    def runs(self) -> pd.DataFrame:
+        return pd.read_sql(
+            "SELECT runs.*, COUNT(results.run_id) AS results, "
+            "SUM(1 - results.reconciled) AS breaks "
+            "FROM runs LEFT JOIN results USING (run_id) "
+            "GROUP BY runs.run_id ORDER BY runs.run_id",
+            self.connection,
+        )
+
+    def query(
+        self,
+        entity_id=None,
+        security_id=None,
+        start_date=None,
+        end_date=None,
+        metric=None,
+        run_id=None,
+        source=None,
+        breaks_only=True,
+        limit=None,
+    ) -> pd.DataFrame:
+        clauses, params = [], []
+        for clause, value in [
+            ("results.entity_id = ?", entity_id),
+            ("results.security_id = ?", security_id),
+            ("results.date >= ?", start_date),
+            ("results.date <= ?", end_date),
+            ("results.metric = ?", metric),
+            ("results.run_id = ?", run_id),
+            ("runs.source = ?", source),
+        ]:
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        if breaks_only:
+            clauses.append("results.reconciled = 0")
+        sql = (
+            "SELECT runs.source, runs.label, runs.left_label, runs.right_label, "
+            "runs.run_date, results.* FROM results JOIN runs USING (run_id)"
+        )
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY results.date, results.entity_id, results.security_id, results.metric"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return pd.read_sql(sql, self.connection, params=params)
+
+
+def add_store_args(parser):
+    parser.add_argument(
+        "-db",
+        "--results_db",
+        dest="results_db",
+        type=str,
+        default=None,
+        help=f"Also store the results in this SQLite file (e.g. {DEFAULT_DB})",
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the recon results store")
+    parser.add_argument(
+        "-db", "--results_db", dest="results_db", type=str, default=DEFAULT_DB
+    )
+    parser.add_argument(
+        "-e",
+        "--entity",
+        dest="entity_id",
+        type=str,
+        default=None,
+        help="Account (or client/household) ID",
+    )
+    parser.add_argument(
+        "-sec", "--security", dest="security_id", type=str, default=None
+    )
+    parser.add_argument("-m", "--metric", dest="metric", type=str, default=None)
+    parser.add_argument(
+        "-sd",
+        "--start_date",
+        dest="start_date",
+        type=str,
+        default=None,
+        help="First date (YYYY-MM-DD)",
+    )
+    parser.add_argument(
+        "-ed",
+        "--end_date",
+        dest="end_date",
+        type=str,
+        default=None,
+        help="Last date (YYYY-MM-DD)",
+    )
+    parser.add_argument(
+        "-ld",
+        "--last_days",
+        dest="last_days",
+        type=int,
+        default=None,
+        help="Only the last N days, up to today",
+    )
+    parser.add_argument("-r", "--run", dest="run_id", type=int, default=None)
+    parser.add_argument(
+        "-src",
+        "--source",
+        dest="source",
+        type=str,
+        default=None,
+        help="my_daily_recon, oa_recon or nav_regression",
+    )
+    parser.add_argument(
+        "-all",
+        "--all",
+        dest="all",
+        action="store_true",
+        default=False,
+        help="Include reconciled rows",
+    )
+    parser.add_argument("-l", "--limit", dest="limit", type=int, default=None)
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        type=str,
+        default=None,
+        help="Save the results to this csv instead of printing them",
+    )
+    parser.add_argument(
+        "--runs",
+        dest="runs",
+        action="store_true",
+        default=False,
+        help="List the ingested runs",
+    )
+    args = parser.parse_args()
+
+    store = ReconStore(args.results_db)
+    if args.runs:
+        results = store.runs()
+    else:
+        start_date = args.start_date
+        if args.last_days is not None:
+            start_date = (
+                datetime.date.today() - datetime.timedelta(days=args.last_days)
+            ).isoformat()
+        results = store.query(
+            entity_id=args.entity_id,
+            security_id=args.security_id,
+            start_date=start_date,
+            end_date=args.end_date,
+            metric=args.metric,
+            run_id=args.run_id,
+            source=args.source,
+            breaks_only=not args.all,
+            limit=args.limit,
+        )
+    store.close()
+    if args.output:
+        results.to_csv(args.output, index=False)
+    else:
+        print(results.to_string(index=False))
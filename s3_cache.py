@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import os
+import tempfile
+import time
+import pandas as pd
+
+LOG = logging.getLogger(__name__)
+
+"""
+Read-through local cache for the S3 inputs of the scripts.
+
+Objects are stored under a key made of their S3 path and ETag, so a file that
+changed on S3 is downloaded again while unchanged ones, including every past
+dated folder, are read from the local disk. Each read costs one HEAD request
+to validate the ETag. The cache directory is bounded in size and the least
+recently used files are evicted first. Files used by the current process, or
+touched by any process within the last RECON_S3_CACHE_KEEP_MINUTES, are never
+evicted, so a file fetched but not yet parsed (by another loader thread or a
+concurrent run) stays on disk; the cache may exceed its bound meanwhile.
+
+    from s3_cache import read_csv
+    positions = read_csv("s3://bucket/apx/client/20250319/Position.csv")
+
+Local paths are passed through to pd.read_csv untouched. Settings come from
+the environment:
+
+    RECON_S3_CACHE          set to 'off' to read S3 directly
+    RECON_S3_CACHE_DIR      cache directory (default ~/.cache/recon_s3)
+    RECON_S3_CACHE_MAX_GB   size bound of the directory (default 20)
+    RECON_S3_CACHE_KEEP_MINUTES  age under which files are not evicted (default 60)
+    AWS_ENDPOINT_URL        S3 endpoint, e.g. a local S3 stand-in
+"""
+
+
+def split_s3_path(path):
+    bucket, _, key = path[len("s3://") :].partition("/")
+    return bucket, key
+
+
+class S3Cache:
+    def __init__(self, cache_dir=None, max_bytes=None, client=None, keep_seconds=None):
+        self.cache_dir = cache_dir or os.environ.get(
+            "RECON_S3_CACHE_DIR", os.path.expanduser("~/.cache/recon_s3")
+        )
+        self.max_bytes = max_bytes or int(
+            float(os.environ.get("RECON_S3_CACHE_MAX_GB", 20)) * 1024**3
+        )
+        self.keep_seconds = (
+            keep_seconds
+            if keep_seconds is not None
+            else float(os.environ.get("RECON_S3_CACHE_KEEP_MINUTES", 60)) * 60
+        )
+        self._client = client
+        # entries handed out by this process, never evicted by it
+        self.used = set()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client(
+                "s3", endpoint_url=os.environ.get("AWS_ENDPOINT_URL")
+            )
+        return self._client
+
+    def cache_file(self, path, etag):
+        """Cache entry of an object version, keeping its extensions for pandas."""
+        digest = hashlib.sha256(f"{path}\n{etag}".encode()).hexdigest()
+        name = os.path.basename(path)
+        suffix = name[name.index(".") :] if "." in name else ""
+        return os.path.join(self.cache_dir, f"{digest}{suffix}")
+
+    def local_path(self, path):
+        """
+        Local copy of an S3 object, downloaded if the cache has no entry for
+        its current ETag.
+        """
+        bucket, key = split_s3_path(path)
+        etag = self.client.head_object(Bucket=bucket, Key=key)["ETag"].strip('"')
+        cache_file = self.cache_file(path, etag)
+        self.used.add(cache_file)
+        if os.path.exists(cache_file):
+            os.utime(cache_file)
+            LOG.debug(f"Cache hit for {path}")
+            return cache_file
+
+        LOG.info(f"Downloading {path}")
+        fd, tmp_file = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        os.close(fd)
+        try:
+            self.client.download_file(bucket, key, tmp_file)
+            os.replace(tmp_file, cache_file)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        self.evict()
+        return cache_file
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits its bound,
+        skipping the entries in use
+        """
+        recent = time.time() - self.keep_seconds
+        entries, total = [], 0
+        for name in os.listdir(self.cache_dir):
+            file_path = os.path.join(self.cache_dir, name)
+            if name.endswith(".part"):
+                continue
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:  # evicted by another process
+                continue
+            total += stat.st_size
+            if file_path not in self.used and stat.st_mtime < recent:
+                entries.append((stat.st_mtime, stat.st_size, file_path))
+        for _, size, file_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            LOG.debug(f"Evicted {file_path}")
+        if total > self.max_bytes:
+            LOG.info(
+                f"Cache {self.cache_dir} holds {total / 1024**3:.2f}GB of files in "
+                f"use, above its {self.max_bytes / 1024**3:.2f}GB bound"
+            )
+
+    def read_csv(self, path, **kwargs):
+        if str(path).startswith("s3://"):
+            path = self.local_path(path)
+        return pd.read_csv(path, **kwargs)
+
+
+_cache = None
+
+
+def default_cache():
+    global _cache
+    if _cache is None:
+        _cache = S3Cache()
+    return _cache
+
+
+def enabled():
+    return os.environ.get("RECON_S3_CACHE", "").lower() != "off"
+
+
+def fetch(path):
+    """
+    Download an S3 object into the shared cache ahead of its read.
+    :return: local path of the copy, or the path itself if it is not cached
+    """
+    if not enabled() or not str(path).startswith("s3://"):
+        return path
+    return default_cache().local_path(path)
+
+
+def read_csv(path, **kwargs):
+    """pd.read_csv through the shared cache, for local and S3 paths."""
+    if not enabled():
+        return pd.read_csv(path, **kwargs)
+    return default_cache().read_csv(path, **kwargs)
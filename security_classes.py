@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+"""
+Classification of securities by their custodian type code (SecurityTypeCode).
+
+The recon scripts split their results by security class. The mapping from
+type codes to classes lives in the table below, shared by MyDailyRecon
+(Category column) and SummarizeRecon (Security Type column), so a new type
+code only has to be added here:
+
+    from security_classes import classify
+    recon["Category"] = classify(recon["Security Type"])
+
+Codes not in the table, including missing ones, fall in the default class.
+Each script can keep its own display names through labels, e.g.
+{"Non Marketable": "Non-marketable"}.
+"""
+
+DEFAULT_CLASS = "Marketable"
+
+SECURITY_CLASSES = {
+    "Cashlike": ["ca"],
+    "True PE": ["pe", "rp"],
+    "Non Marketable": ["en", "hf", "hp", "lp", "oa", "pl", "pp", "zp"],
+}
+
+TYPE_CODE_CLASSES = {
+    code: security_class
+    for security_class, codes in SECURITY_CLASSES.items()
+    for code in codes
+}
+
+
+def classify(type_codes, labels=None) -> pd.Series:
+    """
+    Security class of each type code, in one pass: the codes are factorized
+    and only their distinct values are looked up in the table.
+    :param type_codes: series of SecurityTypeCode values
+    :param labels: optional {class: display name} renames
+    """
+    labels = labels or {}
+    codes, uniques = pd.factorize(type_codes)
+    classes = np.array(
+        [
+            labels.get(name, name)
+            for name in [TYPE_CODE_CLASSES.get(code, DEFAULT_CLASS) for code in uniques]
+            + [DEFAULT_CLASS]
+        ],
+        dtype=object,
+    )
+    # missing codes are factorized to -1, i.e. the default class at the end
+    return pd.Series(classes[codes], index=type_codes.index)
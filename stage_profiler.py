@@ -0,0 +1,97 @@
+import datetime
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+LOG = logging.getLogger(__name__)
+
+"""
+Stage level profile of a pipeline run.
+
+Each stage records its wall time, CPU time of the process, the growth of the
+peak resident set size of the process (how much the stage raised the
+high-water mark) and, when given, the number of rows it produced:
+
+    profiler = StageProfiler(enabled=args.stage_profile)
+    with profiler.stage("merge") as stage:
+        recon = merge(tracking, position)
+        stage["rows"] = len(recon)
+    profiler.save("outputs/2025-03-19_profile.json", client="gresham")
+
+Stages run from concurrent threads overlap, so their CPU time and memory are
+those of the whole process during the stage. A disabled profiler records
+nothing and saves nothing, so the stages can stay in the code.
+"""
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+class StageProfiler:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = []
+        self.extra = {}
+        self.start = time.perf_counter()
+        self.started_at = datetime.datetime.now().isoformat(timespec="seconds")
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """
+        Profile the block; fields set on the yielded dict (e.g. rows) are
+        saved with the stage
+        """
+        record = {"stage": name, **fields}
+        if not self.enabled:
+            yield record
+            return
+        wall, cpu, peak = time.perf_counter(), time.process_time(), peak_rss_mb()
+        try:
+            yield record
+        finally:
+            record["wall_s"] = round(time.perf_counter() - wall, 4)
+            record["cpu_s"] = round(time.process_time() - cpu, 4)
+            end_peak = peak_rss_mb()
+            if end_peak is not None:
+                record["peak_rss_mb"] = round(end_peak, 1)
+                record["peak_rss_delta_mb"] = round(end_peak - peak, 1)
+            self.stages.append(record)
+
+    def extend(self, stages):
+        """Add the stages recorded by another profiler, e.g. in a worker process."""
+        if self.enabled:
+            self.stages.extend(stages)
+
+    def add(self, key, value):
+        """Attach other measurements to the profile, e.g. input load timings."""
+        if self.enabled:
+            self.extra[key] = value
+
+    def save(self, path, **meta):
+        if not self.enabled:
+            return None
+        profile = {
+            **meta,
+            "started_at": self.started_at,
+            "wall_s": round(time.perf_counter() - self.start, 4),
+            "cpu_s": round(time.process_time(), 4),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": self.stages,
+            **self.extra,
+        }
+        with open(path, "w") as f:
+            json.dump(profile, f, indent=2, default=str)
+        LOG.info(f"Stage profile saved to {path}")
+        return profile
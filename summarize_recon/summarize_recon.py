@@ -1,8 +1,13 @@
 import awswrangler as wr
+import numpy as np
 import pandas as pd
 from configparser import ConfigParser
 import logging
 from base_main import BaseMain
+from tolerance import Tolerance, ToleranceEngine
+from break_stats import BreakCube
+import s3_cache
+from security_classes import classify
 
 LOG = logging.getLogger(__name__)
 
@@ -38,7 +43,7 @@ class SummarizeRecon(BaseMain):
             and "breaking" not in file
             and "exception" not in file
         ]
-        recon = pd.read_csv(recon_file[0])
+        recon = s3_cache.read_csv(recon_file[0])
         recon = self.add_security_data(recon)
         recon = self.add_security_type(recon)
         return recon
@@ -47,7 +52,7 @@ class SummarizeRecon(BaseMain):
         files = wr.s3.list_objects(self.data_folder)
         files = [file for file in files if file_type in file]
         files.sort()
-        df = pd.read_csv(files[-1], usecols=kwargs.get("usecols", None))
+        df = s3_cache.read_csv(files[-1], usecols=kwargs.get("usecols", None))
         return df
 
     def build_hierarchy(self):
@@ -107,147 +112,101 @@ class SummarizeRecon(BaseMain):
         return recon
 
     def add_security_type(self, recon):
-        non_marketable = ["en", "hf", "hp", "lp", "oa", "pl", "pp", "zp"]
-        true_pe = ["pe", "rp"]
-        recon.loc[recon["Security Type Code"].isin(non_marketable), "Security Type"] = (
-            "Non-marketable"
+        recon["Security Type"] = classify(
+            recon["Security Type Code"], labels={"Non Marketable": "Non-marketable"}
         )
-        recon.loc[recon["Security Type Code"].isin(true_pe), "Security Type"] = (
-            "True PE"
-        )
-        recon.loc[recon["Security Type Code"] == "ca", "Security Type"] = "Cashlike"
-        recon["Security Type"] = recon["Security Type"].fillna("Marketable")
         return recon
 
-    def summarize_metric(self, recon, metric=None):
-        """
-        Summarize recon data
-        """
-        if metric == "all":
-            recon["all_reconciled"] = (
-                recon["units_reconciled"]
-                & recon["price_reconciled"]
-                & recon["mv_clean_reconciled"]
-            )
-            recon = recon[~recon["all_reconciled"]]
-        elif metric:
-            recon = recon[~recon[f"{metric}_reconciled"]]
-        df = recon[["account", "Security Type"]].rename(
-            columns={"account": "Account ID"}
-        )
-        recon_summary = (
-            df.groupby(["Account ID", "Security Type"])
-            .size()
-            .reset_index()
-            .pivot_table(
-                index=["Account ID"],
-                columns=["Security Type"],
-                values=0,
-                fill_value=0,
-            )
-            .reset_index()
-        )
-        recon_summary["Total"] = recon_summary.iloc[:, 1:].sum(axis=1)
-        recon_summary = recon_summary.melt(
-            id_vars=["Account ID"],
-            value_vars=recon_summary.columns[1:-1],
-            var_name="Security Type",
-            value_name="Count",
-        ).sort_values(
-            by=["Account ID", "Security Type"],
-            ascending=[True, True],
+    @property
+    def break_cube(self):
+        labels = [metric.capitalize() for metric in self.metrics] + ["Any"]
+        return BreakCube(
+            ["Household ID", "Client ID", "Account ID", "Security Type"],
+            labels,
+            any_breaks=False,
         )
 
-        if metric == "all":
-            recon_summary.rename(columns={"Count": "Any Breaks"}, inplace=True)
-        elif metric:
-            recon_summary.rename(
-                columns={"Count": f"{metric.capitalize()} Breaks"}, inplace=True
-            )
-        else:
-            recon_summary.rename(columns={"Count": "Positions"}, inplace=True)
-        return recon_summary
-
-    def summarize_recon(self, recon):
+    def summarize_recon(self, recon, hierarchy):
         """
-        Summarize recon data
+        Count positions and breaks per metric for every hierarchy level and
+        security type in a single pass
         """
-        dfl = []
-        for metric in self.metrics:
-            recon_summary = self.summarize_metric(recon, metric)
-            dfl.append(recon_summary)
-
-        recon_summary = self.summarize_metric(recon)
-        all_recon_summary = self.summarize_metric(recon, "all")
-        for df in dfl:
-            recon_summary = pd.merge(
-                recon_summary,
-                df,
-                how="left",
-            )
-        recon_summary = pd.merge(
-            recon_summary,
-            all_recon_summary,
+        data = recon.rename(columns={"account": "Account ID"}).merge(
+            hierarchy[["Account ID", "Client ID", "Household ID"]],
             how="left",
         )
-        return recon_summary.fillna(0)
-
-    def summarize_by_account(self, recon):
-        df = (
-            recon.drop(columns=["Security Type"])
-            .groupby(
-                ["Account ID", "Account Name", "Custodian", "Client ID", "Household ID"]
-            )
-            .sum()
-            .reset_index()
+        all_reconciled = (
+            data["units_reconciled"]
+            & data["price_reconciled"]
+            & data["mv_clean_reconciled"]
+        )
+        broken = np.column_stack(
+            [~data[f"{metric}_reconciled"].astype(bool) for metric in self.metrics]
+            + [~all_reconciled.astype(bool)]
+        )
+        cube = self.break_cube.build(data, broken)
+        return cube.rename(columns={"Rows": "Positions"})
+
+    def summarize_by_sec_type(self, cube, hierarchy):
+        summary = self.break_cube.slice(cube, "Security Type")
+        value_cols = summary.columns[4:]
+        accounts = summary[
+            ["Household ID", "Client ID", "Account ID"]
+        ].drop_duplicates()
+        security_types = summary[["Security Type"]].drop_duplicates()
+        summary = accounts.merge(security_types, how="cross").merge(
+            summary.drop(columns=["Household ID", "Client ID"]),
+            on=["Account ID", "Security Type"],
+            how="left",
         )
-        return df
-
-    def summarize_by_client(self, recon):
-        df = (
-            recon.drop(
-                columns=["Security Type", "Account ID", "Account Name", "Custodian"]
-            )
-            .groupby(["Client ID", "Household ID"])
-            .sum()
-            .reset_index()
+        summary[value_cols] = summary[value_cols].fillna(0).astype(int)
+        summary = summary.merge(
+            hierarchy[["Account ID", "Account Name", "Custodian"]], how="left"
         )
-        return df
+        return summary[
+            ["Account ID", "Account Name", "Custodian", "Client ID", "Household ID"]
+            + ["Security Type"]
+            + list(value_cols)
+        ].sort_values(["Account ID", "Security Type"])
 
-    def summarize_by_household(self, recon):
-        df = (
-            recon.drop(
-                columns=[
-                    "Security Type",
-                    "Account ID",
-                    "Account Name",
-                    "Custodian",
-                    "Client ID",
-                ]
-            )
-            .groupby(["Household ID"])
-            .sum()
-            .reset_index()
+    def summarize_by_account(self, cube, hierarchy):
+        summary = self.break_cube.slice(cube, "Account ID")
+        summary = summary.merge(
+            hierarchy[["Account ID", "Account Name", "Custodian"]], how="left"
+        )
+        return self.complete_levels(
+            summary,
+            ["Account ID", "Account Name", "Custodian", "Client ID", "Household ID"],
         )
-        return df
 
-    def add_hierarchy(self, recon, hierarchy):
+    def summarize_by_client(self, cube):
+        summary = self.break_cube.slice(cube, "Client ID")
+        return self.complete_levels(summary, ["Client ID", "Household ID"])
+
+    def summarize_by_household(self, cube):
+        summary = self.break_cube.slice(cube, "Household ID")
+        return self.complete_levels(summary, ["Household ID"])
+
+    @staticmethod
+    def complete_levels(summary, keys):
         """
-        Add hierarchy to recon data
+        Rows of a summary with every key known, sorted by the keys: accounts
+        missing from the hierarchy and entities without a household are left
+        out of the account, client and household summaries
         """
-        recon = pd.merge(
-            hierarchy,
-            recon,
-            how="right",
+        value_cols = [col for col in summary.columns if col not in keys]
+        return (
+            summary.dropna(subset=keys)
+            .sort_values(keys)
+            .reset_index(drop=True)[keys + value_cols]
         )
-        return recon
 
     def alternative_summary(self, recon, threshold=50):
         recon["d1g1t_mv_clean"] = recon["d1g1t_mv_clean"].fillna(0)
         recon["custodian_mv_clean"] = recon["custodian_mv_clean"].fillna(0)
-        recon["mv_clean_reconciled"] = (
-            abs(recon["d1g1t_mv_clean"] - recon["custodian_mv_clean"]) < threshold
-        )
+        engine = ToleranceEngine({"mv_clean": Tolerance(absolute=threshold)})
+        result = engine.compare_frame(recon, ["mv_clean"], "d1g1t_{}", "custodian_{}")
+        result.assign(recon, diff=None, reconciled="{}_reconciled")
         return recon
 
 
@@ -257,12 +216,13 @@ if __name__ == "__main__":
     recon_data = work.get_recon()
     hierarchy = work.build_hierarchy()
 
-    summary = work.summarize_recon(recon_data)
-    summary = work.add_hierarchy(summary, hierarchy)
-    summary_by_account = work.summarize_by_account(summary)
-    summary_by_client = work.summarize_by_client(summary)
-    summary_by_household = work.summarize_by_household(summary)
+    cube = work.summarize_recon(recon_data, hierarchy)
+    summary = work.summarize_by_sec_type(cube, hierarchy)
+    summary_by_account = work.summarize_by_account(cube, hierarchy)
+    summary_by_client = work.summarize_by_client(cube)
+    summary_by_household = work.summarize_by_household(cube)
 
+    cube.to_csv("summarize_recon/outputs/recon_break_cube.csv", index=False)
     summary.to_csv("summarize_recon/outputs/recon_summary_by_sec_type.csv", index=False)
     summary_by_account.to_csv(
         "summarize_recon/outputs/recon_summary_by_account.csv", index=False
@@ -275,9 +235,8 @@ if __name__ == "__main__":
     )
 
     alternative_data = work.alternative_summary(recon_data)
-    alternative_summary = work.summarize_recon(alternative_data)
-    alternative_summary = work.add_hierarchy(alternative_summary, hierarchy)
-    alternative_summary_by_household = work.summarize_by_household(alternative_summary)
+    alternative_cube = work.summarize_recon(alternative_data, hierarchy)
+    alternative_summary_by_household = work.summarize_by_household(alternative_cube)
     alternative_summary_by_household.to_csv(
         "summarize_recon/outputs/recon_summary_by_household_alternative.csv",
         index=False,
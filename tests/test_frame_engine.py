@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from frame_engine import (
+    ColumnarEngine,
+    PandasEngine,
+    encoded_outer_join,
+    get_engine,
+    synthetic_inputs,
+)
+
+KEYS = ["Date", "Account ID", "Security ID"]
+
+
+@pytest.fixture(params=["polars", "pyarrow"])
+def engine(request):
+    pytest.importorskip(request.param)
+    return get_engine(request.param)
+
+
+@pytest.fixture
+def inputs():
+    return synthetic_inputs(2000)
+
+
+def assert_same(expected, result):
+    pd.testing.assert_frame_equal(
+        expected, result, check_dtype=False, check_index_type=False
+    )
+
+
+def test_columnar_engine_is_abstract():
+    with pytest.raises(TypeError):
+        ColumnarEngine()
+
+
+def test_left_join_keeps_left_order(engine, inputs):
+    tracking, position, security = inputs
+    # unmatched rows on the left, several left rows per right row
+    security = security.iloc[::2]
+    assert_same(
+        PandasEngine().merge(tracking, security, how="left", on=["Security ID"]),
+        engine.merge(tracking, security, how="left", on=["Security ID"]),
+    )
+
+
+def test_outer_join_sorted_by_key(engine, inputs):
+    tracking, position, _ = inputs
+    assert_same(
+        PandasEngine().merge(tracking, position, how="outer"),
+        engine.merge(tracking, position, how="outer"),
+    )
+
+
+def test_overlapping_columns_get_suffixes(engine, inputs):
+    tracking, _, _ = inputs
+    target = tracking.sample(frac=0.9, random_state=1)
+    target["Units - d1g1t"] += 1
+    expected = PandasEngine().merge(
+        tracking, target, how="outer", on=KEYS, suffixes=["_base", "_target"]
+    )
+    result = engine.merge(
+        tracking, target, how="outer", on=KEYS, suffixes=["_base", "_target"]
+    )
+    assert "Units - d1g1t_target" in result
+    assert_same(expected, result)
+
+
+def test_encoded_outer_join(engine, inputs):
+    tracking, position, _ = inputs
+    expected = encoded_outer_join(PandasEngine(), tracking, position, KEYS)
+    assert_same(expected, encoded_outer_join(engine, tracking, position, KEYS))
+    # same rows as a plain outer join on the key columns
+    plain = tracking.merge(position, how="outer", on=KEYS)
+    assert_same(
+        plain.sort_values(KEYS, ignore_index=True),
+        expected.sort_values(KEYS, ignore_index=True),
+    )
+
+
+def test_encoded_outer_join_missing_keys():
+    left = pd.DataFrame({"A": ["x", None, "y"], "B": [1, 2, 3], "L": [1.0, 2.0, 3.0]})
+    right = pd.DataFrame({"A": [None, "y", "z"], "B": [2, 3, 4], "R": [5.0, 6.0, 7.0]})
+    result = encoded_outer_join(PandasEngine(), left, right, ["A", "B"])
+    assert len(result) == 4
+    row = result[result["A"].isna()]
+    assert row[["L", "R"]].to_numpy().tolist() == [[2.0, 5.0]]
+    assert np.isnan(result.loc[result["A"] == "z", "L"]).all()
@@ -0,0 +1,119 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from s3_cache import S3Cache
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+BUCKET = "recon"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+class CountingClient:
+    """Client wrapper counting the HEAD requests and downloads."""
+
+    def __init__(self, client):
+        self.client = client
+        self.heads = 0
+        self.downloads = 0
+
+    def head_object(self, **kwargs):
+        self.heads += 1
+        return self.client.head_object(**kwargs)
+
+    def download_file(self, *args):
+        self.downloads += 1
+        return self.client.download_file(*args)
+
+
+def put_csv(s3, key, df):
+    s3.put_object(Bucket=BUCKET, Key=key, Body=df.to_csv(index=False).encode())
+    return f"s3://{BUCKET}/{key}"
+
+
+def make_cache(s3, tmp_path, **kwargs):
+    return S3Cache(str(tmp_path / "cache"), client=CountingClient(s3), **kwargs)
+
+
+def age(file_path, seconds):
+    past = time.time() - seconds
+    os.utime(file_path, (past, past))
+
+
+def test_hit_validated_by_head_request(s3, tmp_path):
+    df = pd.DataFrame({"Account ID": ["A", "B"], "Units": [1.5, 2.0]})
+    path = put_csv(s3, "20250319/Position.csv", df)
+    cache = make_cache(s3, tmp_path)
+
+    pd.testing.assert_frame_equal(cache.read_csv(path), df)
+    pd.testing.assert_frame_equal(cache.read_csv(path), df)
+    assert cache.client.heads == 2
+    assert cache.client.downloads == 1
+    assert cache.local_path(path).endswith(".csv")
+
+
+def test_changed_object_downloaded_again(s3, tmp_path):
+    path = put_csv(s3, "Security.csv", pd.DataFrame({"Security ID": ["X"]}))
+    cache = make_cache(s3, tmp_path)
+    first = cache.local_path(path)
+
+    changed = pd.DataFrame({"Security ID": ["X", "Y"]})
+    put_csv(s3, "Security.csv", changed)
+    second = cache.local_path(path)
+
+    assert second != first
+    assert cache.client.downloads == 2
+    pd.testing.assert_frame_equal(cache.read_csv(path), changed)
+
+
+def test_least_recently_used_evicted_first(s3, tmp_path):
+    frame = pd.DataFrame({"Value": range(200)})
+    paths = [put_csv(s3, f"{day}/Position.csv", frame) for day in range(3)]
+    size = len(frame.to_csv(index=False))
+    files = [make_cache(s3, tmp_path).local_path(path) for path in paths[:2]]
+    age(files[0], 7200)
+    age(files[1], 3600)
+
+    # a new process, bounded to two entries, using none of them yet
+    cache = make_cache(s3, tmp_path, max_bytes=2 * size, keep_seconds=60)
+    cache.local_path(paths[2])
+
+    assert not os.path.exists(files[0])
+    assert os.path.exists(files[1])
+
+
+def test_entries_in_use_not_evicted(s3, tmp_path):
+    frame = pd.DataFrame({"Value": range(200)})
+    paths = [put_csv(s3, f"{day}/Position.csv", frame) for day in range(3)]
+    size = len(frame.to_csv(index=False))
+
+    # fetched by this process and not parsed yet, however old
+    cache = make_cache(s3, tmp_path, max_bytes=size, keep_seconds=60)
+    fetched = cache.local_path(paths[0])
+    age(fetched, 7200)
+    # fetched by another process within the keep period
+    other = make_cache(s3, tmp_path).local_path(paths[1])
+    cache.local_path(paths[2])
+
+    assert os.path.exists(fetched)
+    assert os.path.exists(other)
+
+    # once old and unused, the entries go
+    age(other, 7200)
+    make_cache(s3, tmp_path, max_bytes=size, keep_seconds=60).evict()
+    assert not os.path.exists(fetched)
+    assert not os.path.exists(other)
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+from tolerance import Tolerance, ToleranceEngine
+from top_breaks import TopBreaks
+
+
+def chunks(rows=3000, entities=40, parts=6, seed=0):
+    rng = np.random.default_rng(seed)
+    keys = pd.DataFrame(
+        {"Entity ID": rng.integers(0, entities, rows), "Date": np.arange(rows)}
+    )
+    left = rng.normal(100, 5, (rows, 2))
+    right = left + rng.normal(0, 3, (rows, 2))
+    # every entity is spread over several chunks
+    return [
+        (keys.iloc[part], left[part], right[part])
+        for part in np.array_split(np.arange(rows), parts)
+    ]
+
+
+def test_entity_ranking_lists_k_distinct_entities():
+    metrics = ["Units", "Price"]
+    engine = ToleranceEngine({metric: Tolerance(absolute=1) for metric in metrics})
+    top_breaks = TopBreaks(metrics, k=10)
+    worst = []
+    for keys, left, right in chunks():
+        result = engine.compare(metrics, left, right)
+        top_breaks.update(keys, result, left, right)
+        abs_diff = np.where(result.reconciled, np.nan, result.abs_diff)
+        worst.append(
+            pd.DataFrame(abs_diff, columns=metrics).assign(
+                **keys.reset_index(drop=True)
+            )
+        )
+    worst = pd.concat(worst).groupby("Entity ID")[metrics].max()
+
+    report = top_breaks.report()
+    for metric in metrics:
+        ranked = report[(report["Ranking"] == "Entity") & (report["Metric"] == metric)]
+        assert len(ranked) == 10
+        assert ranked["Entity ID"].is_unique
+        expected = worst[metric].nlargest(10)
+        assert ranked["Entity ID"].tolist() == expected.index.tolist()
+        np.testing.assert_allclose(ranked["Abs Diff"], expected.to_numpy())
+
+
+def test_merge_keeps_entities_once():
+    metrics = ["Units", "Price"]
+    engine = ToleranceEngine({metric: Tolerance(absolute=1) for metric in metrics})
+    merged = TopBreaks(metrics, k=5)
+    for keys, left, right in chunks():
+        worker = TopBreaks(metrics, k=5)
+        worker.update(keys, engine.compare(metrics, left, right), left, right)
+        merged.merge(worker)
+    ranked = merged.report().query("Ranking == 'Entity'")
+    assert ranked.groupby("Metric")["Entity ID"].nunique().tolist() == [5, 5]
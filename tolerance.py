@@ -0,0 +1,154 @@
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+from utils import InputValidationError
+
+"""
+Tolerance engine shared by the recon scripts.
+
+Tolerances are configured per metric with strings such as
+
+    Units=0.10,Price=0.01,Market Value=10+0.1%
+
+where each value is an absolute tolerance ("10"), a relative one ("0.1%",
+measured against the reference side) or both combined ("10+0.1%"), in which
+case the allowed difference is their sum. An entry without a metric name
+("0.01") is the default for every metric not listed.
+
+All metrics are checked in a single array operation, and the result carries a
+per-row bitmask of the broken metrics, so breaks can be queried by metric
+without building one boolean column per metric.
+"""
+
+
+@dataclass
+class Tolerance:
+    absolute: float = 0.0
+    relative: float = 0.0
+
+    @classmethod
+    def parse(cls, value: str):
+        tolerance = cls()
+        for part in value.split("+"):
+            part = part.strip()
+            if part.endswith("%"):
+                tolerance.relative = float(part[:-1]) / 100
+            else:
+                tolerance.absolute = float(part)
+        return tolerance
+
+
+class ToleranceResult:
+    def __init__(self, metrics, diff, abs_diff, reconciled):
+        self.metrics = list(metrics)
+        self.diff = diff
+        self.abs_diff = abs_diff
+        self.reconciled = reconciled
+        weights = np.left_shift(1, np.arange(len(self.metrics), dtype=np.uint64))
+        mask_dtype = (
+            np.min_scalar_type(int(weights.sum())) if len(weights) else np.uint8
+        )
+        self.mask = (~reconciled * weights).sum(axis=1).astype(mask_dtype)
+
+    def bit(self, metric):
+        return 1 << self.metrics.index(metric)
+
+    def breaks(self, metric=None):
+        """Boolean row selector of breaks on a metric, or on any metric."""
+        if metric is None:
+            return self.mask != 0
+        return (self.mask & self.bit(metric)) != 0
+
+    def break_counts(self):
+        return pd.Series((~self.reconciled).sum(axis=0), index=self.metrics)
+
+    def assign(
+        self,
+        df,
+        diff="{} - Diff",
+        reconciled="{} - Reconciled",
+        absolute=True,
+    ):
+        """
+        Write the diff and reconciled columns back to a dataframe.
+        :param absolute: write absolute diffs instead of signed ones
+        """
+        diffs = self.abs_diff if absolute else self.diff
+        for index, metric in enumerate(self.metrics):
+            if diff:
+                df[diff.format(metric)] = diffs[:, index]
+            if reconciled:
+                df[reconciled.format(metric)] = self.reconciled[:, index]
+        return df
+
+
+class ToleranceEngine:
+    def __init__(self, tolerances=None, default=None, decimals=None, inclusive=False):
+        """
+        :param tolerances: dict of metric -> Tolerance
+        :param default: Tolerance applied to metrics not in `tolerances`
+        :param decimals: round the absolute diffs before comparing them
+        :param inclusive: a diff equal to the tolerance is reconciled
+        """
+        self.tolerances = tolerances or {}
+        self.default = default
+        self.decimals = decimals
+        self.inclusive = inclusive
+
+    @classmethod
+    def from_string(cls, spec: str, **kwargs):
+        tolerances = {}
+        default = None
+        for item in spec.split(","):
+            if not item.strip():
+                continue
+            if "=" in item:
+                metric, value = item.split("=")
+                tolerances[metric.strip()] = Tolerance.parse(value)
+            else:
+                default = Tolerance.parse(item)
+        return cls(tolerances, default, **kwargs)
+
+    def tolerance_for(self, metric):
+        if metric in self.tolerances:
+            return self.tolerances[metric]
+        if self.default is not None:
+            return self.default
+        raise InputValidationError(f"No tolerance configured for {metric}")
+
+    def compare(self, metrics, left, right):
+        """
+        Compare two (rows x metrics) arrays. Diffs are left - right and the
+        relative tolerances are measured against the right side.
+        """
+        left = np.asarray(left, dtype=float)
+        right = np.asarray(right, dtype=float)
+        diff = left - right
+        abs_diff = np.abs(diff)
+        if self.decimals is not None:
+            abs_diff = np.round(abs_diff, self.decimals)
+        return ToleranceResult(
+            metrics, diff, abs_diff, self.reconciled(metrics, abs_diff, right)
+        )
+
+    def reconciled(self, metrics, abs_diff, reference=None):
+        tolerances = [self.tolerance_for(metric) for metric in metrics]
+        allowed = np.array([tolerance.absolute for tolerance in tolerances])
+        relative = np.array([tolerance.relative for tolerance in tolerances])
+        if reference is not None and relative.any():
+            allowed = allowed + relative * np.abs(reference)
+        if self.inclusive:
+            return abs_diff <= allowed
+        return abs_diff < allowed
+
+    def compare_frame(self, df, metrics, left, right):
+        """
+        Compare the columns of a dataframe, e.g.
+        compare_frame(df, ["Units"], "{} - d1g1t", "{} - Custodian")
+        """
+        return self.compare(
+            metrics,
+            df[[left.format(metric) for metric in metrics]].to_numpy(dtype=float),
+            df[[right.format(metric) for metric in metrics]].to_numpy(dtype=float),
+        )
@@ -0,0 +1,160 @@
+import heapq
+from itertools import count
+import numpy as np
+import pandas as pd
+
+"""
+Streaming report of the largest breaks of a recon.
+
+Recon results are fed chunk by chunk (an entity, a partition, a whole run)
+and only the K largest breaks are kept, in bounded heaps per metric for three
+rankings:
+
+    Absolute  rows with the largest absolute diff
+    Relative  rows with the largest diff relative to the right hand side
+    Entity    entities with the largest single diff, with their worst row
+
+Memory stays at K rows per metric and ranking whatever the size of the recon,
+so the ranked report can be written alongside, or instead of, the full output.
+"""
+
+
+class TopBreaks:
+    RANKINGS = ["Absolute", "Relative", "Entity"]
+
+    def __init__(self, metrics, k=100, entity_column="Entity ID", labels=None):
+        """
+        :param metrics: metric names, in the column order of the recon arrays
+        :param k: number of breaks kept per metric and ranking
+        :param entity_column: key column used for the Entity ranking
+        :param labels: names of the left and right values in the report
+        """
+        self.metrics = list(metrics)
+        self.k = k
+        self.entity_column = entity_column
+        self.labels = list(labels or ["Left", "Right"])
+        self.heaps = {
+            (ranking, metric): [] for ranking in self.RANKINGS for metric in metrics
+        }
+        # item of each entity in the Entity heaps, an entity is kept once
+        self.entity_items = {metric: {} for metric in metrics}
+        self._counter = count()
+
+    def push(self, ranking, metric, value, record):
+        heap = self.heaps[(ranking, metric)]
+        if ranking == "Entity":
+            self.push_entity(heap, self.entity_items[metric], value, record)
+            return
+        item = (value, next(self._counter), record)
+        if len(heap) < self.k:
+            heapq.heappush(heap, item)
+        elif value > heap[0][0]:
+            heapq.heapreplace(heap, item)
+
+    def push_entity(self, heap, entity_items, value, record):
+        """
+        Push the worst row of an entity, replacing its previous one if lower:
+        an entity split over several chunks is pushed once per chunk
+        """
+        entity = record[self.entity_column]
+        current = entity_items.get(entity)
+        if current is not None:
+            if value <= current[0]:
+                return
+            heap.remove(current)
+            heapq.heapify(heap)
+        item = (value, next(self._counter), record)
+        if len(heap) < self.k:
+            heapq.heappush(heap, item)
+        elif value > heap[0][0]:
+            evicted = heapq.heapreplace(heap, item)
+            del entity_items[evicted[2][self.entity_column]]
+        else:
+            return
+        entity_items[entity] = item
+
+    def largest(self, values, rows):
+        """The k rows with the largest values, skipping NaNs."""
+        rows = rows[~np.isnan(values[rows])]
+        if len(rows) > self.k:
+            rows = rows[np.argpartition(values[rows], -self.k)[-self.k :]]
+        return rows
+
+    def candidates(self, ranking, metric, values, rows):
+        """The rows that can still enter the heap of a ranking."""
+        rows = self.largest(values, rows)
+        heap = self.heaps[(ranking, metric)]
+        if len(heap) >= self.k:
+            rows = rows[values[rows] > heap[0][0]]
+        return rows
+
+    def update(self, keys, result, left, right):
+        """
+        :param keys: dataframe of the key columns of the recon rows
+        :param result: ToleranceResult of the recon rows
+        :param left: (rows x metrics) array the diffs were computed from
+        :param right: (rows x metrics) reference array, as in ToleranceEngine.compare
+        """
+        left = np.asarray(left, dtype=float)
+        right = np.asarray(right, dtype=float)
+        entities = keys[self.entity_column].to_numpy()
+        selected = []
+        for index, metric in enumerate(self.metrics):
+            broken = np.flatnonzero(~result.reconciled[:, index])
+            if not len(broken):
+                continue
+            abs_diff = result.abs_diff[:, index]
+            reference = np.abs(right[:, index])
+            relative = np.full(len(abs_diff), np.nan)
+            np.divide(abs_diff, reference, out=relative, where=reference != 0)
+            worst = (
+                pd.Series(abs_diff[broken], index=broken)
+                .groupby(entities[broken])
+                .idxmax()
+                .to_numpy()
+            )
+            for ranking, values, rows in [
+                ("Absolute", abs_diff, broken),
+                ("Relative", relative, broken),
+                ("Entity", abs_diff, worst),
+            ]:
+                rows = self.candidates(ranking, metric, values, rows)
+                selected.append((ranking, metric, index, values, rows, relative))
+        if not selected:
+            return
+
+        # key records of the candidate rows only, not of the whole chunk
+        rows = np.unique(np.concatenate([item[4] for item in selected]))
+        records = dict(zip(rows, keys.iloc[rows].to_dict("records")))
+        for ranking, metric, index, values, rows, relative in selected:
+            for row in rows:
+                self.push(
+                    ranking,
+                    metric,
+                    values[row],
+                    {
+                        **records[row],
+                        self.labels[0]: left[row, index],
+                        self.labels[1]: right[row, index],
+                        "Diff": result.diff[row, index],
+                        "Abs Diff": result.abs_diff[row, index],
+                        "Relative Diff": relative[row],
+                    },
+                )
+
+    def merge(self, other):
+        """Fold in the breaks kept by another reporter, e.g. from a worker."""
+        for (ranking, metric), heap in other.heaps.items():
+            for value, _, record in heap:
+                self.push(ranking, metric, value, record)
+        return self
+
+    def report(self) -> pd.DataFrame:
+        rows = []
+        for (ranking, metric), heap in self.heaps.items():
+            ranked = sorted(heap, key=lambda item: (-item[0], item[1]))
+            for rank, (_, _, record) in enumerate(ranked, start=1):
+                rows.append(
+                    {"Ranking": ranking, "Metric": metric, "Rank": rank, **record}
+                )
+        return pd.DataFrame(rows)
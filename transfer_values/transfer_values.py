@@ -3,6 +3,8 @@ import pandas as pd
 from configparser import ConfigParser
 import logging
 from base_main import BaseMain
+from frame_engine import get_engine, add_engine_args
+import s3_cache
 
 LOG = logging.getLogger(__name__)
 
@@ -56,6 +58,7 @@ class TransferValues(BaseMain):
         self.env = constants.get(self.args.profile, "ENVIRONMENT")
         self.region = constants.get(self.args.profile, "REGION")
         self.base_cur = constants.get(self.args.profile, "BASE_CURRENCY")
+        self.engine = get_engine(self.args.engine)
         self.export_path = (
             f"s3://d1g1t-client-{self.region.lower()}/{self.client.lower()}/exports"
         )
@@ -69,6 +72,7 @@ class TransferValues(BaseMain):
             required=True,
             help="Client profile to be used",
         )
+        add_engine_args(self.parser)
 
     def get_fx_rates(self):
         fx_rates = pd.read_csv(
@@ -89,7 +93,7 @@ class TransferValues(BaseMain):
         ).strftime("%Y-%m-%d")
 
         total_fx = (
-            temp_fx.merge(fx_rates, how="left")
+            self.engine.merge(temp_fx, fx_rates, how="left")
             .ffill()
             .melt(
                 id_vars="Trade Date",
@@ -112,7 +116,7 @@ class TransferValues(BaseMain):
         return adjusted_table
 
     def get_prices(self):
-        security_prices = pd.read_csv(
+        security_prices = s3_cache.read_csv(
             f"{self.export_path}/{self.env}-{self.client.lower()}-prices.csv.gz"
         )
         security_prices = security_prices[
@@ -139,7 +143,9 @@ class TransferValues(BaseMain):
         return security_prices
 
     def get_instruments(self):
-        instruments = pd.read_csv(f"{self.export_path}/instruments-{self.env}.csv")
+        instruments = s3_cache.read_csv(
+            f"{self.export_path}/instruments-{self.env}.csv"
+        )
         currencies = instruments[["InstrumentID", "Name", "Currency"]].rename(
             columns={
                 "InstrumentID": "Security ID",
@@ -156,7 +162,7 @@ class TransferValues(BaseMain):
         return instruments, currencies
 
     def get_transactions(self):
-        trx = pd.read_csv(
+        trx = s3_cache.read_csv(
             f"{self.export_path}/{self.env}-{self.client.lower()}-transactions.csv.gz"
         )
         trx = trx[trx["Is Cancelled"] == "f"]
@@ -221,11 +227,11 @@ class TransferValues(BaseMain):
 
         cash = cash[cash["Trade FxRate"].isna()]
         cash = cash.assign(TransferValueTradeCurrency=cash["d1g1t Transaction Amount"])
-        cash = cash.merge(fx_rates, how="left")
+        cash = self.engine.merge(cash, fx_rates, how="left")
         cash["FX Rate"] = cash["FX Rate"].fillna(1)
         cash["Trade FxRate"] = cash["Trade FxRate"].fillna(cash["FX Rate"])
         cash["FX Rate"] = cash["Trade FxRate"]
-        cash = cash.merge(cad_usd_fx, how="left")
+        cash = self.engine.merge(cash, cad_usd_fx, how="left")
 
         if self.base_cur == "CAD":
             cash = cash.assign(
@@ -253,7 +259,7 @@ class TransferValues(BaseMain):
         securities = transactions[
             transactions["d1g1t Transaction Type"].str.contains("security")
         ]
-        securities = securities.merge(instruments, how="left")
+        securities = self.engine.merge(securities, instruments, how="left")
 
         # Transfers with market value
         sec_with_mv = securities[
@@ -265,9 +271,9 @@ class TransferValues(BaseMain):
                 "Market Value in Transaction Currency"
             ]
         )
-        sec_with_mv = sec_with_mv.merge(fx_rates, how="left")
+        sec_with_mv = self.engine.merge(sec_with_mv, fx_rates, how="left")
         sec_with_mv["FX Rate"] = sec_with_mv["FX Rate"].fillna(1)
-        sec_with_mv = sec_with_mv.merge(cad_usd_fx, how="left")
+        sec_with_mv = self.engine.merge(sec_with_mv, cad_usd_fx, how="left")
 
         if self.base_cur == "CAD":
             sec_with_mv = sec_with_mv.assign(
@@ -297,13 +303,13 @@ class TransferValues(BaseMain):
         securities = transactions[
             transactions["d1g1t Transaction Type"].str.contains("security")
         ]
-        securities = securities.merge(instruments, how="left")
+        securities = self.engine.merge(securities, instruments, how="left")
 
         empty_mv = securities[securities["Market Value in Transaction Currency"].isna()]
         empty_mv = empty_mv[empty_mv["d1g1t Transaction Quantity"] != 0]
         empty_mv = empty_mv[~empty_mv["Security ID"].str.contains("-legacy")]
 
-        empty_mv = empty_mv.merge(cad_usd_fx, how="left")
+        empty_mv = self.engine.merge(empty_mv, cad_usd_fx, how="left")
         empty_mv.loc[empty_mv["Security Currency"] == "CAD", "TransferValueCAD"] = (
             empty_mv["d1g1t Transaction Quantity"]
             * empty_mv["UoM"]
@@ -410,8 +416,10 @@ class TransferValues(BaseMain):
         prices = self.get_prices()
         instruments, currencies = self.get_instruments()
         transactions = self.get_transactions()
-        transactions = transactions.merge(currencies, how="left").merge(
-            prices, how="left"
+        transactions = self.engine.merge(
+            self.engine.merge(transactions, currencies, how="left"),
+            prices,
+            how="left",
         )
         final_cols = list(transactions.columns)
         cash = self.create_transfer_value_cols_for_cash(
@@ -1,10 +1,13 @@
+from collections import deque
 from dataclasses import dataclass
 import datetime
 from dateutil import parser
+import json
 import logging
 import numpy
 import os
 import pandas as pd
+import time
 
 
 def logger_setup(
@@ -320,6 +323,98 @@ class ChartTableFormatter:
             self._get_row(item=nested_item, current_depth=current_depth)
 
 
+class ProgressTracker:
+    """
+    Aggregates task completions reported by a parent process and logs
+    throughput, rolling latency percentiles, error rate and ETA every
+    `interval` seconds. The parent waits for completions at most
+    `next_report_in()` seconds and calls `poll()` on a timeout, so reports
+    keep coming while no task completes.
+    """
+
+    def __init__(self, total, logger, interval=60, window=500):
+        """
+        :param total: number of tasks expected
+        :param logger: logger used for the periodic reports
+        :param interval: seconds between two reports
+        :param window: number of most recent latencies used for percentiles
+        """
+        self.total = total
+        self.logger = logger
+        self.interval = interval
+        self.completed = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=window)
+        self.started_at = time.monotonic()
+        self.last_report = self.started_at
+
+    def update(self, latency: float, ok: bool = True) -> None:
+        self.completed += 1
+        if not ok:
+            self.errors += 1
+        self.latencies.append(latency)
+        self.poll()
+
+    def next_report_in(self) -> float:
+        """Seconds until the next report is due."""
+        return max(self.last_report + self.interval - time.monotonic(), 0.0)
+
+    def poll(self) -> None:
+        """Report if the interval has elapsed since the last report."""
+        now = time.monotonic()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    def stats(self) -> dict:
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        per_minute = self.completed / elapsed * 60
+        remaining = self.total - self.completed
+        eta = remaining / per_minute * 60 if per_minute else None
+        latencies = numpy.array(self.latencies) if self.latencies else None
+        return {
+            "total": self.total,
+            "completed": self.completed,
+            "errors": self.errors,
+            "error_rate": self.errors / self.completed if self.completed else 0.0,
+            "entities_per_minute": per_minute,
+            "latency_p50": (
+                float(numpy.percentile(latencies, 50))
+                if latencies is not None
+                else None
+            ),
+            "latency_p95": (
+                float(numpy.percentile(latencies, 95))
+                if latencies is not None
+                else None
+            ),
+            "elapsed_seconds": elapsed,
+            "eta_seconds": eta,
+        }
+
+    def report(self) -> None:
+        stats = self.stats()
+        eta = (
+            str(datetime.timedelta(seconds=round(stats["eta_seconds"])))
+            if stats["eta_seconds"] is not None
+            else "n/a"
+        )
+        latency = (
+            f"p50 {stats['latency_p50']:.1f}s / p95 {stats['latency_p95']:.1f}s"
+            if stats["latency_p50"] is not None
+            else "n/a"
+        )
+        self.logger.info(
+            f"Progress {stats['completed']}/{stats['total']} | "
+            f"{stats['entities_per_minute']:.1f}/min | latency {latency} | "
+            f"errors {stats['error_rate']:.1%} | ETA {eta}"
+        )
+
+    def save_summary(self, file_path: str) -> None:
+        with open(file_path, "w") as f:
+            json.dump(self.stats(), f, indent=4)
+
+
 # Custom Exceptions
 
 